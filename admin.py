@@ -4,14 +4,38 @@ Manage licenses, view payments, and monitor system usage
 """
 
 import streamlit as st
-import json
 import os
+import tempfile
 from datetime import datetime
-import pandas as pd
+
+import metrics
+from credit_store import (
+    set_credits, delete_license, get_store, cache_stats, search_licenses, license_totals
+)
+from payment_log import (
+    PAYMENT_LOG_FILE, PAYMENT_ROLLUPS_FILE, iter_payments, load_rollups, recent_payments
+)
+from payment_export import EXPORT_FORMATS, export_payments, parquet_available
+from webhook_server import WEBHOOK_QUEUE_FILE
 
 # Admin password (set in secrets)
 ADMIN_PASSWORD = "admin123"  # Change this in production!
 
+# Payment history: rows shown in the table
+PAYMENT_HISTORY_ROWS = 1000
+
+# Email domains listed in the payment statistics
+PAYMENT_TOP_DOMAINS = 20
+
+# Licenses shown per page of the license table
+LICENSE_PAGE_ROWS = 50
+
+# Largest balance that can be entered for a license
+LICENSE_MAX_CREDITS = 1_000_000
+
+# Largest export offered as a download; Streamlit holds the whole file in memory
+EXPORT_DOWNLOAD_MAX_BYTES = 50 * 1024 * 1024
+
 def check_admin_auth():
     """Check if user is authenticated as admin."""
     if 'admin_authenticated' not in st.session_state:
@@ -36,67 +60,93 @@ def admin_login():
         else:
             st.error("❌ Invalid password")
 
-def load_credits():
-    """Load credits from JSON or secrets."""
-    try:
-        if "credits" in st.secrets:
-            return dict(st.secrets["credits"])
-    except:
-        pass
-    
-    credits_file = "credits.json"
-    if os.path.exists(credits_file):
-        with open(credits_file, 'r') as f:
-            return json.load(f)
-    return {}
+def load_payment_log():
+    """Stream payment log entries, oldest first."""
+    return iter_payments()
 
-def save_credits(credits):
-    """Save credits to JSON file."""
-    credits_file = "credits.json"
-    try:
-        with open(credits_file, 'w') as f:
-            json.dump(credits, f, indent=2)
-        return True
-    except:
-        return False
+def payment_frame(entries):
+    """DataFrame of payment log entries with formatted timestamps."""
+    import pandas as pd
+    
+    df = pd.DataFrame(entries)
+    
+    # Format timestamp
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d %H:%M')
+    
+    # Reorder columns
+    columns_order = ['timestamp', 'license_key', 'email', 'amount_eur', 'credits', 'plan_id']
+    return df.reindex(columns=columns_order)
 
-def load_payment_log():
-    """Load payment log."""
-    log_file = "payment_log.json"
-    if os.path.exists(log_file):
-        with open(log_file, 'r') as f:
-            return json.load(f)
-    return []
+def rollup_frame(table, label):
+    """DataFrame of one rollup table (by_day, by_plan or by_domain)."""
+    import pandas as pd
+    
+    return pd.DataFrame([
+        {
+            label: key,
+            "Transactions": values["transactions"],
+            "Revenue (€)": values["revenue_cents"] / 100,
+            "Credits": values["credits"]
+        }
+        for key, values in table.items()
+    ], columns=[label, "Transactions", "Revenue (€)", "Credits"])
 
 def show_license_management():
     """Display license key management interface."""
+    import pandas as pd
+    
     st.markdown("### 🔑 License Key Management")
     
-    credits = load_credits()
+    # Totals are maintained by the store; no need to load every license
+    total_licenses, total_credits = license_totals()
     
-    # Display existing licenses
-    if credits:
-        st.markdown("#### Active License Keys")
-        
-        df = pd.DataFrame([
-            {"License Key": key, "Credits": value}
-            for key, value in credits.items()
-        ])
-        
-        st.dataframe(df, use_container_width=True)
-        
-        # Total credits
-        total_credits = sum(credits.values())
-        total_licenses = len(credits)
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric("Total Licenses", total_licenses)
-        with col2:
-            st.metric("Total Credits Available", total_credits)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric("Total Licenses", total_licenses)
+    with col2:
+        st.metric("Total Credits Available", total_credits)
+    
+    # Search and page through licenses on the server
+    st.markdown("#### Active License Keys")
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("Search", placeholder="License key or part of it").strip().upper()
+    with col2:
+        match = st.radio("Match", ["Starts with", "Contains"], horizontal=True)
+    
+    search = (query, match)
+    if st.session_state.get('license_search') != search:
+        st.session_state.license_search = search
+        st.session_state.license_page = 0
+    page = st.session_state.license_page
+    
+    # One extra row tells whether there is a next page
+    rows = search_licenses(query, page * LICENSE_PAGE_ROWS, LICENSE_PAGE_ROWS + 1, match == "Contains")
+    has_next = len(rows) > LICENSE_PAGE_ROWS
+    rows = rows[:LICENSE_PAGE_ROWS]
+    
+    if rows:
+        df = pd.DataFrame(rows, columns=["License Key", "Credits"])
+        st.dataframe(df, use_container_width=True, hide_index=True)
+    elif query:
+        st.info("No license keys match your search.")
     else:
         st.info("No license keys found.")
     
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        if st.button("⬅️ Previous", disabled=page == 0, use_container_width=True):
+            st.session_state.license_page -= 1
+            st.rerun()
+    with col2:
+        st.caption(f"Page {page + 1}, {LICENSE_PAGE_ROWS} per page")
+    with col3:
+        if st.button("Next ➡️", disabled=not has_next, use_container_width=True):
+            st.session_state.license_page += 1
+            st.rerun()
+    
     st.markdown("---")
     
     # Add new license
@@ -108,12 +158,11 @@ def show_license_management():
         new_key = st.text_input("License Key", placeholder="CUSTOM-KEY-2024")
     
     with col2:
-        new_credits = st.number_input("Credits", min_value=1, value=10)
+        new_credits = st.number_input("Credits", min_value=1, max_value=LICENSE_MAX_CREDITS, value=10)
     
     if st.button("Create License", type="primary"):
         if new_key:
-            credits[new_key.upper()] = new_credits
-            if save_credits(credits):
+            if set_credits(new_key.upper(), new_credits):
                 st.success(f"✅ Created license '{new_key.upper()}' with {new_credits} credits")
                 st.rerun()
             else:
@@ -126,84 +175,144 @@ def show_license_management():
     # Modify existing license
     st.markdown("#### ✏️ Modify License")
     
-    if credits:
+    # Only the licenses on the current search page are offered
+    if rows:
+        page_credits = dict(rows)
         col1, col2 = st.columns(2)
         
         with col1:
-            selected_key = st.selectbox("Select License", list(credits.keys()))
+            selected_key = st.selectbox("Select License", list(page_credits.keys()))
         
         with col2:
-            updated_credits = st.number_input("New Credits", min_value=0, value=credits.get(selected_key, 0))
+            updated_credits = st.number_input(
+                "New Credits", min_value=0, max_value=LICENSE_MAX_CREDITS,
+                value=min(page_credits.get(selected_key, 0), LICENSE_MAX_CREDITS)
+            )
         
         col1, col2 = st.columns(2)
         
         with col1:
             if st.button("Update Credits", use_container_width=True):
-                credits[selected_key] = updated_credits
-                if save_credits(credits):
+                if set_credits(selected_key, updated_credits):
                     st.success(f"✅ Updated '{selected_key}' to {updated_credits} credits")
                     st.rerun()
         
         with col2:
             if st.button("Delete License", use_container_width=True):
                 if st.session_state.get('confirm_delete') == selected_key:
-                    del credits[selected_key]
-                    if save_credits(credits):
+                    if delete_license(selected_key):
                         st.success(f"✅ Deleted '{selected_key}'")
                         st.session_state.confirm_delete = None
                         st.rerun()
                 else:
                     st.session_state.confirm_delete = selected_key
                     st.warning("⚠️ Click again to confirm deletion")
+    else:
+        st.info("Search for a license above to modify it.")
 
 def show_payment_history():
     """Display payment transaction history."""
     st.markdown("### 💰 Payment History")
     
-    payments = load_payment_log()
+    # Totals and time series come from the rollups kept next to the log,
+    # the table from the end of the log; neither reads the whole history
+    with metrics.timer("admin_payment_log_load"):
+        rollups = load_rollups()
+        recent = recent_payments(PAYMENT_HISTORY_ROWS)
     
-    if payments:
-        # Convert to DataFrame
-        df = pd.DataFrame(payments)
-        
-        # Format timestamp
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d %H:%M')
-        
-        # Reorder columns
-        columns_order = ['timestamp', 'license_key', 'email', 'amount_eur', 'credits', 'plan_id']
-        df = df[[col for col in columns_order if col in df.columns]]
-        
+    totals = rollups["totals"]
+    total_transactions = totals.get("transactions", 0)
+    
+    if total_transactions:
+        df = payment_frame(recent)
         st.dataframe(df, use_container_width=True)
         
+        if total_transactions > len(df):
+            st.caption(f"Showing the latest {len(df):,} of {total_transactions:,} transactions")
+        
         # Statistics
         st.markdown("#### 📊 Statistics")
         
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            st.metric("Total Transactions", len(payments))
+            st.metric("Total Transactions", total_transactions)
         
         with col2:
-            total_revenue = sum([p.get('amount_eur', 0) for p in payments])
-            st.metric("Total Revenue", f"€{total_revenue:.2f}")
+            st.metric("Total Revenue", f"€{totals.get('revenue_cents', 0) / 100:.2f}")
         
         with col3:
-            total_credits_sold = sum([p.get('credits', 0) for p in payments])
-            st.metric("Credits Sold", total_credits_sold)
+            st.metric("Credits Sold", totals.get("credits", 0))
+        
+        # Revenue over time
+        by_day = rollup_frame(rollups["by_day"], "Day").sort_values("Day")
+        st.markdown("#### 📈 Revenue by Day")
+        st.bar_chart(by_day.set_index("Day")["Revenue (€)"])
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            st.markdown("#### By Plan")
+            by_plan = rollup_frame(rollups["by_plan"], "Plan")
+            st.dataframe(by_plan.sort_values("Revenue (€)", ascending=False), use_container_width=True, hide_index=True)
+        
+        with col2:
+            st.markdown("#### Top Email Domains")
+            by_domain = rollup_frame(rollups["by_domain"], "Domain")
+            st.dataframe(
+                by_domain.nlargest(PAYMENT_TOP_DOMAINS, "Revenue (€)"),
+                use_container_width=True,
+                hide_index=True
+            )
         
-        # Export option
         st.markdown("---")
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="📥 Download CSV",
-            data=csv,
-            file_name=f"payments_{datetime.now().strftime('%Y%m%d')}.csv",
-            mime="text/csv"
-        )
+        show_payment_export(sorted(rollups["by_plan"]))
     else:
         st.info("No payment history found.")
 
+def show_payment_export(plans):
+    """Filtered CSV/Parquet export, streamed from the log into a temporary file."""
+    st.markdown("#### 📥 Export")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        dates = st.date_input("Date Range", value=(), format="YYYY-MM-DD")
+    
+    with col2:
+        selected_plans = st.multiselect("Plans", plans)
+    
+    with col3:
+        formats = ["csv", "parquet"] if parquet_available() else ["csv"]
+        export_format = st.radio("Format", formats, format_func=str.upper, horizontal=True)
+    
+    if st.button("📦 Prepare Export"):
+        start = dates[0] if len(dates) > 0 else None
+        end = dates[1] if len(dates) > 1 else None
+        
+        # Only one chunk of entries is in memory while the file is written
+        with tempfile.TemporaryFile() as export_file:
+            with metrics.timer("admin_payment_export"):
+                count = export_payments(export_file, export_format, start=start, end=end, plans=selected_plans)
+            size = export_file.tell()
+            
+            if size > EXPORT_DOWNLOAD_MAX_BYTES:
+                st.warning(
+                    f"This export is {size / 1024 / 1024:,.0f} MB ({count:,} payments), too large to download "
+                    f"here (limit {EXPORT_DOWNLOAD_MAX_BYTES / 1024 / 1024:,.0f} MB). Narrow the filters "
+                    f"or run `python payment_export.py {export_format} OUTPUT` on the server."
+                )
+            else:
+                export_file.seek(0)
+                st.download_button(
+                    label=f"📥 Download {export_format.upper()} ({count:,} payments)",
+                    data=export_file.read(),
+                    file_name=f"payments_{datetime.now().strftime('%Y%m%d')}.{export_format}",
+                    mime=EXPORT_FORMATS[export_format]
+                )
+    
+    st.caption("Very large exports: `python payment_export.py csv|parquet OUTPUT [--from DATE] [--to DATE] [--plan PLAN]`")
+
 def show_system_info():
     """Display system information and settings."""
     st.markdown("### ⚙️ System Information")
@@ -241,7 +350,11 @@ def show_system_info():
     
     files_status = {
         "credits.json": os.path.exists("credits.json"),
-        "payment_log.json": os.path.exists("payment_log.json")
+        "credits.log": os.path.exists("credits.log"),
+        "credits.db": os.path.exists("credits.db"),
+        PAYMENT_LOG_FILE: os.path.exists(PAYMENT_LOG_FILE),
+        PAYMENT_ROLLUPS_FILE: os.path.exists(PAYMENT_ROLLUPS_FILE),
+        WEBHOOK_QUEUE_FILE: os.path.exists(WEBHOOK_QUEUE_FILE)
     }
     
     for file, exists in files_status.items():
@@ -249,6 +362,77 @@ def show_system_info():
             st.success(f"✅ {file}")
         else:
             st.info(f"ℹ️ {file} (will be created on first use)")
+    
+    # Shared credit index (file backends only; SQLite needs no cache)
+    stats = cache_stats()
+    if "hits" in stats:
+        st.markdown("#### Credit Cache")
+        
+        lookups = stats["hits"] + stats["misses"]
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Cache Hits", stats["hits"])
+        with col2:
+            st.metric("Cache Misses", stats["misses"])
+        with col3:
+            st.metric("Hit Rate", f"{stats['hits'] / lookups:.1%}" if lookups else "n/a")
+    
+    # Credit ledger
+    if hasattr(get_store(), "compact"):
+        if st.button("🗜️ Compact Credit Ledger"):
+            get_store().compact()
+            st.success("✅ credits.log folded into credits.json")
+    
+    show_latency_summary()
+
+def show_latency_summary():
+    """Per-stage latency of the app process, from the same data as /metrics."""
+    import pandas as pd
+    
+    st.markdown("#### ⏱️ Latency by Stage")
+    
+    app_metrics = metrics.load_summary()
+    series = dict(app_metrics["series"])
+    
+    # Admin page loads are measured in this process
+    series.update({
+        name: values for name, values in metrics.summary()["series"].items()
+        if name.startswith("admin_")
+    })
+    
+    if not series:
+        st.info("No measurements yet. Set METRICS_PORT or METRICS_FLUSH_FILE to see the app's metrics here.")
+        return
+    
+    def ms(seconds):
+        return round(seconds * 1000, 1) if seconds is not None else None
+    
+    df = pd.DataFrame([
+        {
+            "stage": name[:-len("_seconds")] if name.endswith("_seconds") else name,
+            "count": values["count"],
+            "p50_ms": ms(values["p50"]),
+            "p95_ms": ms(values["p95"]),
+            "p99_ms": ms(values["p99"]),
+            "total_s": round(values["sum"], 2)
+        }
+        for name, values in sorted(series.items())
+    ])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    
+    counters = app_metrics["counters"]
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Gemini Retries", counters.get("gemini_retries_total", 0))
+    with col2:
+        st.metric("Parse Failures", counters.get("valuation_parse_failures_total", 0))
+    with col3:
+        st.metric("Queue Depth", counters.get("gemini_queue_depth", 0))
+    with col4:
+        st.metric("Deadline Exceeded", counters.get("gemini_deadline_exceeded_total", 0))
+    
+    updated = datetime.fromtimestamp(app_metrics["timestamp"]).strftime('%Y-%m-%d %H:%M:%S')
+    st.caption(f"App metrics as of {updated}")
 
 def main():
     """Main admin panel."""
@@ -280,11 +464,14 @@ def main():
     
     # Display selected page
     if page == "License Management":
-        show_license_management()
+        with metrics.timer("admin_licenses_page"):
+            show_license_management()
     elif page == "Payment History":
-        show_payment_history()
+        with metrics.timer("admin_payments_page"):
+            show_payment_history()
     elif page == "System Info":
-        show_system_info()
+        with metrics.timer("admin_system_page"):
+            show_system_info()
 
 if __name__ == "__main__":
     main()
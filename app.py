@@ -1,11 +1,14 @@
 import streamlit as st
-import google.generativeai as genai
-import json
-import os
-from PIL import Image
-import io
 from datetime import datetime
 
+from appraiser import configure_gemini, warm_model, analyze_item_with_gemini, STREAMING_ENABLED
+from batch import appraise_batch, results_to_csv, BATCH_MAX_WORKERS
+from image_pipeline import preprocess_image
+from valuation import format_price
+from valuation_cache import CHARGE_CACHE_HITS
+from similar_items import get_similar_items, dhash
+from metrics import start_exporters
+
 # Import payment module
 try:
     from payments import show_pricing_page, handle_payment_callback, init_stripe
@@ -29,157 +32,180 @@ st.set_page_config(
 # GOOGLE_API_KEY = "your-api-key-here"
 try:
     GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
-    genai.configure(api_key=GOOGLE_API_KEY)
+    configure_gemini(GOOGLE_API_KEY)
 except Exception as e:
     st.error("⚠️ Google API Key not found in secrets. Please configure it in .streamlit/secrets.toml")
     st.stop()
 
+# The Gemini model (GEMINI_MODEL, PROMPT_VERSION) is created once per
+# process in appraiser.py and shared by every session. The SDK is imported
+# in the background, so the first page renders without waiting for it.
+warm_model()
+
+# Per-stage latency histograms on METRICS_PORT / METRICS_FLUSH_FILE
+start_exporters()
+
 # ============================================================================
 # CREDITS MANAGEMENT SYSTEM
 # ============================================================================
 
-CREDITS_FILE = "credits.json"
-
-def load_credits():
-    """Load credits from Streamlit secrets (cloud) or JSON file (local)."""
-    # Try to load from Streamlit secrets first (for cloud deployment)
-    try:
-        if "credits" in st.secrets:
-            return dict(st.secrets["credits"])
-    except:
-        pass
-    
-    # Fallback to local JSON file (for local development)
-    if not os.path.exists(CREDITS_FILE):
-        # Initialize with demo data
-        default_credits = {
-            "DEMO-KEY": 3,
-            "CLIENT-100": 50,
-            "PREMIUM-2024": 100,
-            "TEST-KEY": 10
-        }
-        save_credits(default_credits)
-        return default_credits
-    
-    try:
-        with open(CREDITS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        st.error(f"Error loading credits: {e}")
-        return {}
-
-def save_credits(credits_data):
-    """Save credits to JSON file. Fails silently on cloud (uses secrets instead)."""
-    try:
-        with open(CREDITS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(credits_data, f, indent=2)
-        return True
-    except Exception as e:
-        # On cloud, file system is read-only for app directory
-        # Credits should be managed via Streamlit secrets
-        return False
-
-def validate_license_key(key):
-    """Check if license key is valid and has credits."""
-    credits = load_credits()
-    if key in credits and credits[key] > 0:
-        return True, credits[key]
-    return False, 0
-
-def deduct_credit(key):
-    """Deduct one credit from the license key."""
-    credits = load_credits()
-    if key in credits and credits[key] > 0:
-        credits[key] -= 1
-        save_credits(credits)
-        return True
-    return False
+# Credits live in credit_store.py (shared with admin.py and payments.py).
+# By default they are kept in credits.db (SQLite), which is created from
+# credits.json on first start. Set CREDITS_BACKEND = "ledger" to append
+# changes to credits.log, or "json" to rewrite credits.json on every change.
+from credit_store import (
+    validate_license_key, deduct_credit,
+    reserve_credit, commit_reservation, release_reservation
+)
 
 # HOW TO ADD MORE LICENSE KEYS:
-# 1. Open credits.json file
-# 2. Add a new line with format: "YOUR-KEY-NAME": number_of_credits
-# 3. Save the file
-# Example:
-# {
-#   "DEMO-KEY": 3,
-#   "NEW-CLIENT": 25,  <-- Add this line
-#   "PREMIUM-2024": 100
-# }
+# Use the admin panel: streamlit run admin.py
+# (with CREDITS_BACKEND = "json", you can also edit credits.json directly:
+#  "YOUR-KEY-NAME": number_of_credits)
 
 # ============================================================================
-# AI ANALYSIS FUNCTION
+# STREAMLIT UI
 # ============================================================================
 
-def analyze_item_with_gemini(image):
-    """
-    Analyze uploaded image using Google Gemini API.
-    Returns structured JSON with item valuation.
-    """
-    try:
-        # Initialize Gemini model
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Craft the expert appraiser prompt
-        prompt = """You are an expert appraiser and valuation specialist with decades of experience across antiques, collectibles, electronics, furniture, and everyday items.
-
-Analyze the item in this image and provide a detailed valuation report in STRICT JSON format.
+REPORT_DEFAULTS = {
+    "item_name": "Unknown",
+    "condition": "Not specified",
+    "price_new": 0,
+    "price_used_fast": 0,
+    "price_collector": 0,
+    "description": "No description available"
+}
 
-Your response must be ONLY valid JSON (no markdown, no explanations outside JSON) with these exact fields:
+def render_report_layout():
+    """Lay out an empty valuation report. Returns {field: placeholder}."""
+    st.markdown("---")
+    st.markdown("### 📊 Valuation Report")
+    
+    # Item Info
+    col1, col2 = st.columns(2)
+    slots = {
+        "item_name": col1.empty(),
+        "condition": col2.empty()
+    }
+    
+    st.markdown("---")
+    
+    # Price metrics
+    st.markdown("### 💰 Estimated Values (EUR)")
+    
+    col1, col2, col3 = st.columns(3)
+    slots["price_new"] = col1.empty()
+    slots["price_used_fast"] = col2.empty()
+    slots["price_collector"] = col3.empty()
+    
+    st.markdown("---")
+    
+    # Sales Description
+    st.markdown("### 📝 Ready-to-Use Sales Description")
+    slots["description"] = st.empty()
+    
+    st.info("💡 **Tip:** Copy the text above and paste it directly into your Bazaar or Facebook Marketplace listing!")
+    
+    return slots
 
-{
-  "item_name": "Clear identification of the item",
-  "condition": "Excellent/Good/Fair/Poor - with brief explanation",
-  "price_new": "Estimated retail price if brand new (numeric value in EUR)",
-  "price_used_fast": "Quick sale price for bazaar/Facebook Marketplace (numeric value in EUR)",
-  "price_collector": "High-end collector/auction price if rare/vintage (numeric value in EUR)",
-  "description": "A compelling 2-3 sentence sales description suitable for a classified ad, highlighting key features and value proposition"
-}
+def fill_report_field(slots, key, value):
+    """Show one completed field of a valuation report."""
+    if key == "item_name":
+        slots[key].markdown(f"**Item:** {value}")
+    elif key == "condition":
+        slots[key].markdown(f"**Condition:** {value}")
+    elif key == "price_new":
+        slots[key].metric("🆕 New Price", f"€{format_price(value)}", help="Estimated retail price if brand new")
+    elif key == "price_used_fast":
+        slots[key].metric("⚡ Quick Sale", f"€{format_price(value)}", help="Fast sale price (Bazaar/Facebook)")
+    elif key == "price_collector":
+        slots[key].metric("🏆 Collector Price", f"€{format_price(value)}", help="High-end collector/auction price")
+    elif key == "description":
+        slots[key].text_area(
+            "Copy this description for your ad:",
+            value=value,
+            height=120,
+            label_visibility="collapsed"
+        )
 
-Important guidelines:
-- Be realistic and conservative with valuations
-- Consider visible condition, brand, age, and market demand
-- All prices in EUR (€)
-- For common items, collector price may equal or be slightly above used_fast price
-- For rare/vintage items, collector price can be significantly higher
-- Description should be persuasive but honest
+def fill_report(slots, data, skip=()):
+    """Fill every report field not in skip, using defaults for missing ones."""
+    for key, default in REPORT_DEFAULTS.items():
+        if key not in skip:
+            fill_report_field(slots, key, data.get(key, default))
 
-Analyze the image now and respond with ONLY the JSON object."""
+def show_valuation_report(data):
+    """Render a valuation report (item, condition, prices, description)."""
+    fill_report(render_report_layout(), data)
+    
+    # Timestamp
+    st.caption(f"Analysis completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
-        # Generate response
-        response = model.generate_content([prompt, image])
-        
-        # Parse JSON from response
-        response_text = response.text.strip()
-        
-        # Clean up potential markdown formatting
-        if response_text.startswith("```json"):
-            response_text = response_text[7:]
-        if response_text.startswith("```"):
-            response_text = response_text[3:]
-        if response_text.endswith("```"):
-            response_text = response_text[:-3]
+def show_batch_appraisal():
+    """Value many photos at once, streaming each report as it completes."""
+    batch_files = st.file_uploader(
+        "Choose images...",
+        type=['jpg', 'jpeg', 'png'],
+        accept_multiple_files=True,
+        key="batch_files",
+        label_visibility="collapsed"
+    )
+    
+    if not batch_files:
+        st.caption(
+            f"Select several photos to appraise them in parallel ({BATCH_MAX_WORKERS} at a time). "
+            "Each successful item costs 1 credit."
+        )
+    else:
+        st.markdown(f"**{len(batch_files)} photos selected**")
         
-        result = json.loads(response_text.strip())
+        if len(batch_files) > st.session_state.credits:
+            st.warning(f"⚠️ Only {st.session_state.credits} credits left - some items will not be appraised.")
         
-        return {
-            "success": True,
-            "data": result
-        }
+        if st.button("🔍 Appraise All", use_container_width=True, type="primary", key="batch_analyze"):
+            from PIL import Image
+            items = [(f.name, Image.open(f)) for f in batch_files]
+            progress = st.progress(0.0, text="🤖 AI is analyzing your items...")
+            results = []
+            
+            for result in appraise_batch(items, st.session_state.license_key):
+                results.append(result)
+                if result["charged"]:
+                    st.session_state.credits -= 1
+                
+                progress.progress(
+                    len(results) / len(items),
+                    text=f"{len(results)} of {len(items)} items done"
+                )
+                
+                if result["success"]:
+                    data = result["data"]
+                    with st.expander(f"✅ {result['name']} - {data.get('item_name', 'Unknown')}"):
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("🆕 New Price", f"€{format_price(data.get('price_new', 0))}")
+                        with col2:
+                            st.metric("⚡ Quick Sale", f"€{format_price(data.get('price_used_fast', 0))}")
+                        with col3:
+                            st.metric("🏆 Collector Price", f"€{format_price(data.get('price_collector', 0))}")
+                        st.markdown(f"**Condition:** {data.get('condition', 'Not specified')}")
+                        st.write(data.get('description', 'No description available'))
+                else:
+                    st.error(f"❌ {result['name']}: {result.get('error', 'Unknown error occurred')}")
+            
+            st.session_state.batch_results = results
+    
+    if st.session_state.get("batch_results"):
+        results = st.session_state.batch_results
+        succeeded = sum(1 for r in results if r["success"])
+        st.caption(f"{succeeded} of {len(results)} items appraised")
         
-    except json.JSONDecodeError as e:
-        return {
-            "success": False,
-            "error": f"Failed to parse AI response. The AI didn't return valid JSON. Try again or use a clearer image."
-        }
-    except Exception as e:
-        return {
-            "success": False,
-            "error": f"AI Analysis Error: {str(e)}"
-        }
-
-# ============================================================================
-# STREAMLIT UI
-# ============================================================================
+        st.download_button(
+            label="📥 Download CSV",
+            data=results_to_csv(results),
+            file_name=f"valuations_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
+            mime="text/csv"
+        )
 
 def main():
     # Handle payment callbacks first
@@ -366,7 +392,7 @@ def main():
     st.markdown("### 📸 Upload or Capture Item Photo")
     
     # Image input options
-    tab1, tab2 = st.tabs(["📁 Upload Image", "📷 Take Photo"])
+    tab1, tab2, tab3 = st.tabs(["📁 Upload Image", "📷 Take Photo", "📦 Batch Appraisal"])
     
     uploaded_file = None
     
@@ -382,93 +408,138 @@ def main():
         if camera_photo is not None:
             uploaded_file = camera_photo
     
+    with tab3:
+        show_batch_appraisal()
+    
     # Process image if uploaded
     if uploaded_file is not None:
-        # Display image
-        image = Image.open(uploaded_file)
+        # Decode, orient, shrink and re-encode once per uploaded file
+        file_id = getattr(uploaded_file, "file_id", None)
+        if file_id is None or st.session_state.get("processed_file_id") != file_id:
+            from PIL import Image
+            st.session_state.processed_image = preprocess_image(
+                Image.open(uploaded_file),
+                original_bytes=uploaded_file.size
+            )
+            st.session_state.processed_image["phash"] = dhash(st.session_state.processed_image["image"])
+            st.session_state.processed_file_id = file_id
         
+        processed = st.session_state.processed_image
+        image = processed["blob"]
+        
+        # Display image
         col1, col2, col3 = st.columns([1, 2, 1])
         with col2:
-            st.image(image, caption="Item to Analyze", use_container_width=True)
+            st.image(processed["image"], caption="Item to Analyze", use_container_width=True)
+            
+            stats = processed["stats"]
+            if stats["bytes_saved"] and stats["bytes_saved"] > 0:
+                st.caption(
+                    f"Optimized for upload: {stats['original_bytes'] / 1024:.0f} KB → "
+                    f"{stats['output_bytes'] / 1024:.0f} KB in {stats['total_ms']:.0f} ms"
+                )
+        
+        # Offer an earlier valuation of the same item photographed again
+        similar_items = get_similar_items()
+        similar = similar_items.find_similar(processed["phash"], limit=1) if similar_items else []
+        
+        if similar:
+            previous = similar[0]["valuation"]
+            st.info(
+                f"🔁 A similar item was already appraised: **{previous.get('item_name', 'Unknown')}** "
+                f"(quick sale €{format_price(previous.get('price_used_fast', 0))})"
+            )
+            
+            if st.button("♻️ Use Previous Valuation", use_container_width=True):
+                if not CHARGE_CACHE_HITS or deduct_credit(st.session_state.license_key):
+                    if CHARGE_CACHE_HITS:
+                        st.session_state.credits -= 1
+                    show_valuation_report(previous)
+                    st.caption("♻️ Reused valuation of a near-identical photo - no new AI analysis was run.")
+                else:
+                    st.error("Failed to deduct credit. Please try again.")
         
         # Analyze button
         if st.button("🔍 Analyze Item & Get Valuation", use_container_width=True, type="primary"):
             
+            # Hold a credit before calling the API so parallel tabs
+            # cannot spend more credits than the key has
+            reservation = reserve_credit(st.session_state.license_key)
+            
+            if reservation is None:
+                st.error("❌ You have no credits remaining. Please purchase more credits.")
+                st.stop()
+            
+            status = st.empty()
+            report_area = st.empty()
+            
             with st.spinner("🤖 AI is analyzing your item... This may take a few seconds..."):
+                # Fields appear in the report as soon as the model has written them
+                with report_area.container():
+                    slots = render_report_layout()
+                
+                streamed = set()
+                
+                def on_field(key, value):
+                    if not streamed:
+                        status.empty()
+                    streamed.add(key)
+                    fill_report_field(slots, key, value)
+                
+                def on_queue(position):
+                    status.info(f"⏳ High demand right now - you are number {position} in the queue...")
+                
                 # Call Gemini API
-                result = analyze_item_with_gemini(image)
+                try:
+                    result = analyze_item_with_gemini(
+                        image,
+                        image_hash=processed["phash"],
+                        on_field=on_field if STREAMING_ENABLED else None,
+                        license_key=st.session_state.license_key,
+                        on_queue=on_queue
+                    )
+                except BaseException:
+                    release_reservation(reservation)
+                    raise
                 
-                if result["success"]:
-                    # Deduct credit
-                    if deduct_credit(st.session_state.license_key):
+                if result["success"] and result.get("cached") and not CHARGE_CACHE_HITS:
+                    # Repeat of an earlier valuation; free under this policy
+                    release_reservation(reservation)
+                    credit_ok = True
+                elif result["success"]:
+                    # Charge the reserved credit (or a fresh one if the
+                    # reservation expired during a very slow call)
+                    credit_ok = commit_reservation(reservation) or deduct_credit(st.session_state.license_key)
+                    if credit_ok:
                         st.session_state.credits -= 1
-                        
-                        data = result["data"]
-                        
+                
+                if result["success"]:
+                    if credit_ok:
                         # Display results
-                        st.success("✅ Analysis Complete!")
-                        
-                        st.markdown("---")
-                        st.markdown("### 📊 Valuation Report")
-                        
-                        # Item Info
-                        col1, col2 = st.columns(2)
-                        with col1:
-                            st.markdown(f"**Item:** {data.get('item_name', 'Unknown')}")
-                        with col2:
-                            st.markdown(f"**Condition:** {data.get('condition', 'Not specified')}")
-                        
-                        st.markdown("---")
-                        
-                        # Price metrics
-                        st.markdown("### 💰 Estimated Values (EUR)")
+                        status.success("✅ Analysis Complete!")
+                        if result.get("retried"):
+                            # Streamed fields came from the discarded first response
+                            streamed.clear()
+                        fill_report(slots, result["data"], skip=streamed)
                         
-                        col1, col2, col3 = st.columns(3)
-                        
-                        with col1:
-                            st.metric(
-                                "🆕 New Price",
-                                f"€{data.get('price_new', 0)}",
-                                help="Estimated retail price if brand new"
-                            )
-                        
-                        with col2:
-                            st.metric(
-                                "⚡ Quick Sale",
-                                f"€{data.get('price_used_fast', 0)}",
-                                help="Fast sale price (Bazaar/Facebook)"
-                            )
-                        
-                        with col3:
-                            st.metric(
-                                "🏆 Collector Price",
-                                f"€{data.get('price_collector', 0)}",
-                                help="High-end collector/auction price"
-                            )
-                        
-                        st.markdown("---")
-                        
-                        # Sales Description
-                        st.markdown("### 📝 Ready-to-Use Sales Description")
-                        
-                        description = data.get('description', 'No description available')
-                        
-                        st.text_area(
-                            "Copy this description for your ad:",
-                            value=description,
-                            height=120,
-                            label_visibility="collapsed"
+                        # Timestamp
+                        timings = result["timings"]
+                        st.caption(
+                            f"Analysis completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} · "
+                            f"⏱️ first field after {timings['first_field']:.1f} s, "
+                            f"complete after {timings['total']:.1f} s"
                         )
                         
-                        st.info("💡 **Tip:** Copy the text above and paste it directly into your Bazaar or Facebook Marketplace listing!")
-                        
-                        # Timestamp
-                        st.caption(f"Analysis completed: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+                        if result.get("cached"):
+                            st.caption("⚡ This photo was appraised before - result served from cache.")
                         
                     else:
+                        report_area.empty()
                         st.error("Failed to deduct credit. Please try again.")
                 
                 else:
+                    report_area.empty()
+                    release_reservation(reservation)
                     st.error(f"❌ {result.get('error', 'Unknown error occurred')}")
                     st.info("💡 Try uploading a clearer image or a different angle of the item.")
 
@@ -0,0 +1,332 @@
+"""
+ValueAI - Appraiser
+Shared Gemini model handle and the item valuation call
+"""
+
+import datetime
+import io
+import threading
+import time
+
+import metrics
+from image_pipeline import preprocess_image
+from json_stream import IncrementalJSONObject
+from quota import wait_for_quota
+from resilience import GEMINI_DEADLINE, call_with_resilience, stream_with_resilience
+from settings import get_setting
+from similar_items import get_similar_items, dhash
+from valuation import ValuationResult, ValuationSchema, repair_json_text
+from valuation_cache import get_valuation_cache, image_cache_key
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+GEMINI_MODEL = get_setting("GEMINI_MODEL", "gemini-1.5-flash")
+
+# Selects the instructions below; also part of the valuation cache key
+PROMPT_VERSION = get_setting("PROMPT_VERSION", "v1")
+
+# Try to hold the instructions in a Gemini context cache (paid per hour,
+# and only accepted once the cached content reaches the model's minimum size)
+GEMINI_CONTEXT_CACHE = get_setting("GEMINI_CONTEXT_CACHE", False)
+GEMINI_CONTEXT_CACHE_TTL = get_setting("GEMINI_CONTEXT_CACHE_TTL", 3600)
+
+# Fixed appraiser instructions, sent once as the model's system instruction
+PROMPTS = {
+    "v1": """You are an expert appraiser and valuation specialist with decades of experience across antiques, collectibles, electronics, furniture, and everyday items.
+
+Analyze the item in the image you are given and provide a detailed valuation report in STRICT JSON format.
+
+Your response must be ONLY valid JSON (no markdown, no explanations outside JSON) with these exact fields:
+
+{
+  "item_name": "Clear identification of the item",
+  "condition": "Excellent/Good/Fair/Poor - with brief explanation",
+  "price_new": "Estimated retail price if brand new (numeric value in EUR)",
+  "price_used_fast": "Quick sale price for bazaar/Facebook Marketplace (numeric value in EUR)",
+  "price_collector": "High-end collector/auction price if rare/vintage (numeric value in EUR)",
+  "description": "A compelling 2-3 sentence sales description suitable for a classified ad, highlighting key features and value proposition"
+}
+
+Important guidelines:
+- Be realistic and conservative with valuations
+- Consider visible condition, brand, age, and market demand
+- All prices in EUR (€)
+- For common items, collector price may equal or be slightly above used_fast price
+- For rare/vintage items, collector price can be significantly higher
+- Description should be persuasive but honest"""
+}
+
+# The only text sent with every request
+REQUEST_TEXT = "Appraise this item and respond with ONLY the JSON object."
+
+# Stream responses in the UI so fields appear while the rest is generated
+STREAMING_ENABLED = get_setting("STREAMING_ENABLED", True)
+
+# ============================================================================
+# MODEL HANDLE
+# ============================================================================
+
+_genai = None
+_api_key = None
+_model = None
+_model_lock = threading.Lock()
+_genai_lock = threading.Lock()
+_warmed = False
+
+
+def configure_gemini(api_key=None):
+    """
+    Set GOOGLE_API_KEY (from secrets or the environment). The SDK itself
+    is only imported and configured on first use, see get_genai().
+    """
+    global _api_key
+    api_key = api_key or get_setting("GOOGLE_API_KEY")
+    if not api_key:
+        raise RuntimeError("GOOGLE_API_KEY is not configured")
+    _api_key = api_key
+    if _genai is not None:
+        _genai.configure(api_key=api_key)
+
+
+def get_genai():
+    """
+    Import google.generativeai (about a second with its gRPC and protobuf
+    dependencies) on first use, keeping it off the app's startup path.
+    """
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                with metrics.timer("gemini_sdk_import"):
+                    import google.generativeai as genai
+                if _api_key:
+                    genai.configure(api_key=_api_key)
+                _genai = genai
+    return _genai
+
+
+def _create_model():
+    genai = get_genai()
+    instructions = PROMPTS[PROMPT_VERSION]
+
+    # Constrain the model to JSON matching ValuationSchema (numeric prices)
+    generation_config = genai.GenerationConfig(
+        response_mime_type="application/json",
+        response_schema=ValuationSchema
+    )
+
+    if GEMINI_CONTEXT_CACHE:
+        try:
+            cached_content = genai.caching.CachedContent.create(
+                model=GEMINI_MODEL,
+                display_name=f"valueai-appraiser-{PROMPT_VERSION}",
+                system_instruction=instructions,
+                ttl=datetime.timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL)
+            )
+            return genai.GenerativeModel.from_cached_content(
+                cached_content, generation_config=generation_config
+            )
+        except Exception as e:
+            # Typically the instructions are below the minimum cacheable size
+            print(f"Context cache unavailable, using system instruction: {e}")
+
+    return genai.GenerativeModel(
+        GEMINI_MODEL,
+        system_instruction=instructions,
+        generation_config=generation_config
+    )
+
+
+def get_model():
+    """Return the process-wide Gemini model shared by every session."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = _create_model()
+    return _model
+
+
+def use_model(model):
+    """Replace the shared model, e.g. with a local fake for load tests."""
+    global _model, _warmed
+    with _model_lock:
+        _model = model
+        _warmed = model is not None
+    return model
+
+
+def warm_model():
+    """
+    Import the SDK, build the model handle and open the API connection in
+    the background so neither the first render nor the first analysis
+    pays for it. Only the first call per process does anything, so this
+    is safe to run on every rerun.
+    """
+    global _warmed
+    if _warmed:
+        return
+    _warmed = True
+
+    def run():
+        try:
+            get_model().count_tokens(REQUEST_TEXT)
+        except Exception as e:
+            print(f"Gemini warm-up failed: {e}")
+
+    threading.Thread(target=run, name="gemini-warm-up", daemon=True).start()
+
+
+# ============================================================================
+# AI ANALYSIS FUNCTION
+# ============================================================================
+
+def _generate(image, on_field, start):
+    """Call the model; returns (response_text, seconds_to_first_field)."""
+    contents = [REQUEST_TEXT, image]
+    request_options = {"timeout": GEMINI_DEADLINE}
+
+    if on_field is None:
+        text = call_with_resilience(
+            lambda: get_model().generate_content(contents, request_options=request_options).text
+        )
+        return text, None
+
+    state = {}
+
+    def request():
+        # A retried stream starts over with a fresh parser
+        state["parser"] = IncrementalJSONObject()
+        state["chunks"] = []
+        return get_model().generate_content(contents, stream=True, request_options=request_options)
+
+    def on_chunk(chunk):
+        state["chunks"].append(chunk.text)
+        completed = state["parser"].feed(chunk.text)
+        for key, value in completed:
+            if "first_field" not in state:
+                state["first_field"] = time.perf_counter() - start
+            on_field(key, value)
+        return bool(completed)
+
+    stream_with_resilience(request, on_chunk)
+    return "".join(state["chunks"]), state.get("first_field")
+
+
+def _decode(response_text):
+    """
+    Decode model output into a ValuationResult, with one local repair
+    attempt (fences, surrounding prose, trailing commas). None if invalid.
+    """
+    metrics.inc("valuation_parse_total")
+    with metrics.timer("valuation_parse"):
+        try:
+            return ValuationResult.from_json(response_text)
+        except ValueError:
+            metrics.inc("valuation_parse_failures_total")
+
+        try:
+            valuation = ValuationResult.from_json(repair_json_text(response_text))
+            metrics.inc("valuation_repairs_total")
+            return valuation
+        except ValueError:
+            return None
+
+
+def analyze_item_with_gemini(image, image_hash=None, on_field=None, license_key=None, on_queue=None):
+    """
+    Analyze uploaded image using Google Gemini API.
+    Accepts a PIL image or a preprocessed {"mime_type", "data"} blob, plus
+    its perceptual hash if already known.
+
+    With on_field, the response is streamed and on_field(key, value) is
+    called for each top-level field as soon as it is complete.
+
+    Calls wait for the shared Gemini quota at the priority of license_key's
+    plan; on_queue(position) is called while the request is queued.
+
+    Returns {"success": True, "data": ValuationResult, ...}; "cached" is
+    True when the same image was already valued, "retried" is True when
+    the data comes from the automatic retry (so fields already passed to
+    on_field are stale), and "timings" holds the
+    seconds to the first complete field, to the full response and spent
+    waiting for quota.
+    An unusable response is repaired or retried once automatically.
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    try:
+        # Shrink and re-encode raw images before uploading them
+        if isinstance(image, Image.Image):
+            processed = preprocess_image(image)
+            image = processed["blob"]
+            image_hash = image_hash or dhash(processed["image"])
+
+        # Identical photos reuse the previous valuation
+        cache = get_valuation_cache()
+        cache_key = image_cache_key(image, PROMPT_VERSION)
+        if cache is not None:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                try:
+                    valuation = ValuationResult.from_dict(cached)
+                except ValueError:
+                    valuation = None  # Entry from before the schema; value again
+                if valuation is not None:
+                    elapsed = time.perf_counter() - start
+                    return {
+                        "success": True,
+                        "data": valuation,
+                        "cached": True,
+                        "retried": False,
+                        "timings": {"first_field": elapsed, "total": elapsed, "queued": 0.0}
+                    }
+
+        # Generate response; the model is constrained to ValuationSchema
+        queued = wait_for_quota(license_key, on_queue)
+        response_text, first_field = _generate(image, on_field, start)
+        valuation = _decode(response_text)
+        retried = valuation is None
+
+        if retried:
+            # Single automatic retry instead of a manual one by the user
+            metrics.inc("valuation_retries_total")
+            queued += wait_for_quota(license_key, on_queue)
+            response_text, _ = _generate(image, None, start)
+            valuation = _decode(response_text)
+
+        if valuation is None:
+            metrics.inc("valuation_failed_total")
+            return {
+                "success": False,
+                "error": "Failed to parse AI response. The AI didn't return valid JSON. Try again or use a clearer image."
+            }
+
+        if cache is not None:
+            cache.put(cache_key, valuation.to_dict())
+
+        # Make the valuation findable for near-duplicate photos
+        similar_items = get_similar_items()
+        if similar_items is not None:
+            if image_hash is None:
+                image_hash = dhash(Image.open(io.BytesIO(image["data"])))
+            similar_items.add(image_hash, valuation.to_dict())
+
+        total = time.perf_counter() - start
+        metrics.observe("appraisal_seconds", total)
+        return {
+            "success": True,
+            "data": valuation,
+            "cached": False,
+            "retried": retried,
+            "timings": {"first_field": first_field or total, "total": total, "queued": queued}
+        }
+
+    except Exception as e:
+        return {
+            "success": False,
+            "error": f"AI Analysis Error: {str(e)}"
+        }
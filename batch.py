@@ -0,0 +1,132 @@
+"""
+ValueAI - Batch Appraisal
+Values many photos concurrently, charging one credit per successful item
+"""
+
+import csv
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from appraiser import analyze_item_with_gemini
+from credit_store import reserve_credit, commit_reservation, release_reservation
+from settings import get_setting
+from valuation_cache import CHARGE_CACHE_HITS
+
+# Parallel Gemini calls per batch; raise until the API quota is the limit
+BATCH_MAX_WORKERS = get_setting("BATCH_MAX_WORKERS", 4)
+
+NO_CREDITS_ERROR = "No credits remaining"
+
+CSV_FIELDS = [
+    "file", "item_name", "condition",
+    "price_new", "price_used_fast", "price_collector",
+    "description", "error"
+]
+
+
+def appraise_one(name, image, license_key, record=None):
+    """
+    Reserve a credit, value one image and settle the credit.
+    image may be a PIL image, a preprocessed blob or a file path.
+
+    record, if given, is called with the result before the credit is
+    committed, so a result that was persisted is never charged twice.
+    Returns {"name", "success", "data" | "error", "billable", "charged",
+    "cached", "seconds"}.
+    """
+    start = time.perf_counter()
+
+    reservation = reserve_credit(license_key)
+    if reservation is None:
+        return {
+            "name": name,
+            "success": False,
+            "error": NO_CREDITS_ERROR,
+            "billable": False,
+            "charged": False,
+            "cached": False,
+            "seconds": time.perf_counter() - start
+        }
+
+    try:
+        if isinstance(image, str):
+            from PIL import Image
+            image = Image.open(image)
+        result = analyze_item_with_gemini(image, license_key=license_key)
+
+        billable = result["success"] and (CHARGE_CACHE_HITS or not result.get("cached"))
+        result.update({
+            "name": name,
+            "cached": result.get("cached", False),
+            "billable": billable,
+            "charged": False,
+            "seconds": time.perf_counter() - start
+        })
+        if record is not None:
+            record(result)
+    except BaseException:
+        release_reservation(reservation)
+        raise
+
+    if billable:
+        result["charged"] = commit_reservation(reservation)
+    else:
+        release_reservation(reservation)
+    return result
+
+
+def appraise_batch(items, license_key, max_workers=BATCH_MAX_WORKERS, record=None):
+    """
+    Value (name, image) pairs on a bounded thread pool.
+    items may be any iterable; at most 2 * max_workers images are pending
+    at once. Yields each result as soon as it completes, in completion order.
+    """
+    items = iter(items)
+    pending = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="appraise") as pool:
+        try:
+            while True:
+                while len(pending) < 2 * max_workers:
+                    item = next(items, None)
+                    if item is None:
+                        break
+                    name, image = item
+                    pending[pool.submit(appraise_one, name, image, license_key, record)] = name
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        yield future.result()
+                    except Exception as e:
+                        yield {
+                            "name": name,
+                            "success": False,
+                            "error": f"AI Analysis Error: {e}",
+                            "billable": False,
+                            "charged": False,
+                            "cached": False,
+                            "seconds": 0.0
+                        }
+        finally:
+            # Stopped early (e.g. out of credits): drop work not yet started
+            for future in pending:
+                future.cancel()
+
+
+def results_to_csv(results):
+    """CSV text of the item_name/price_* fields for a list of batch results."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for result in results:
+        row = {"file": result["name"], "error": result.get("error", "")}
+        if result.get("data"):
+            row.update(result["data"].to_dict())
+        writer.writerow(row)
+    return buffer.getvalue()
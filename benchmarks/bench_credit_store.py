@@ -0,0 +1,71 @@
+"""
+ValueAI - Credit Store Throughput Benchmark
+Measures concurrent deductions per second for each credit backend
+
+Usage: python benchmarks/bench_credit_store.py [--threads 8] [--deductions 20000]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import credit_store
+
+
+def make_store(backend, workdir):
+    json_path = os.path.join(workdir, "credits.json")
+    if backend == "json":
+        return credit_store.JsonCreditStore(json_path)
+    if backend == "ledger":
+        return credit_store.LedgerCreditStore(json_path, os.path.join(workdir, "credits.log"))
+    return credit_store.SqliteCreditStore(os.path.join(workdir, "credits.db"), migrate_from=None)
+
+
+def run(backend, threads, deductions):
+    with tempfile.TemporaryDirectory() as workdir:
+        store = make_store(backend, workdir)
+        store.save({"BENCH-KEY": deductions, "OTHER-KEY": 1})
+
+        per_thread = deductions // threads
+        # Every thread tries for more credits than it is entitled to, so
+        # the balance must end at exactly zero with no lost updates
+        succeeded = [0] * threads
+
+        def worker(index):
+            for _ in range(per_thread + 10):
+                if store.deduct("BENCH-KEY"):
+                    succeeded[index] += 1
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+        total = sum(succeeded)
+        remaining = store.get("BENCH-KEY")
+        correct = total + remaining == deductions and remaining >= 0
+        print(f"{backend:>7}: {total / elapsed:10.0f} deductions/s "
+              f"({total} ok, {remaining} left, {'exact' if correct else 'MISMATCH'})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--deductions", type=int, default=20000)
+    parser.add_argument("--backends", default="sqlite,ledger,json")
+    args = parser.parse_args()
+
+    for backend in args.backends.split(","):
+        run(backend, args.threads, args.deductions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+ValueAI - Payment Export Memory Benchmark
+Peak memory of the payment history export at growing log sizes
+
+Seeds payment logs of each size and exports them with the streaming
+CSV and Parquet writers (payment_export.py) and, for comparison, the
+old way: one DataFrame of the whole log turned into one CSV string.
+Python allocations are measured with tracemalloc; on Linux the peak
+RSS of each export (which includes pyarrow's buffers) is measured too.
+Exits with status 1 if a streaming export's traced peak at the largest
+size exceeds --max-growth times its peak at the smallest.
+
+Usage: python benchmarks/bench_export.py [--sizes 20000,200000,1000000] [--max-growth 1.5]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import payment_export
+from microbench import seed_payment_log
+
+
+def export_in_memory(out):
+    """The former admin export: whole log -> DataFrame -> CSV string."""
+    import pandas as pd
+    from payment_log import iter_payments
+
+    data = pd.DataFrame(list(iter_payments())).to_csv(index=False)
+    out.write(data.encode("utf-8"))
+
+
+def _reset_peak_rss():
+    """Reset the kernel's high-water mark of this process (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def measure(fn):
+    """(seconds, peak traced MB, peak RSS MB or None, output MB) of fn(out)."""
+    with tempfile.TemporaryFile() as out:
+        rss_available = _reset_peak_rss()
+        tracemalloc.start()
+        start = time.perf_counter()
+        fn(out)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss = _peak_rss_mb() if rss_available else None
+        size = out.tell()
+
+    return elapsed, peak / 1e6, rss, size / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--sizes", default="20000,200000,1000000", help="payment log entries")
+    parser.add_argument("--max-growth", type=float, default=1.5)
+    parser.add_argument("--skip-in-memory", action="store_true", help="skip the DataFrame baseline")
+    args = parser.parse_args()
+
+    methods = {"csv (streamed)": lambda out: payment_export.export_payments(out, "csv")}
+    if payment_export.parquet_available():
+        methods["parquet (streamed)"] = lambda out: payment_export.export_payments(out, "parquet")
+    if not args.skip_in_memory:
+        try:
+            import pandas  # noqa: F401
+            methods["csv (DataFrame)"] = export_in_memory
+        except ImportError:
+            print("pandas not installed; skipping the DataFrame baseline")
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    peaks = {name: [] for name in methods}
+    cwd = os.getcwd()
+
+    print(f"{'entries':>10}  {'method':<20} {'seconds':>8} {'peak MB':>9} {'RSS MB':>9} {'file MB':>8}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            # payment_log uses paths relative to the working directory
+            os.chdir(workdir)
+            try:
+                seed_payment_log("payment_log.jsonl", size)
+                for name, fn in methods.items():
+                    seconds, peak, rss, file_mb = measure(fn)
+                    peaks[name].append(peak)
+                    rss = f"{rss:9.1f}" if rss is not None else f"{'-':>9}"
+                    print(f"{size:>10}  {name:<20} {seconds:8.2f} {peak:9.1f} {rss} {file_mb:8.1f}")
+            finally:
+                os.chdir(cwd)
+
+    failed = []
+    for name, values in peaks.items():
+        growth = values[-1] / values[0] if values[0] else 1.0
+        print(f"{name:<20} peak x{growth:.2f} from {sizes[0]:,} to {sizes[-1]:,} entries")
+        if "streamed" in name and growth > args.max_growth:
+            failed.append(name)
+
+    if failed:
+        print(f"Memory grew with the log size: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
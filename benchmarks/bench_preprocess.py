@@ -0,0 +1,99 @@
+"""
+ValueAI - Image Preprocessing Benchmark
+Compares payload size and end-to-end latency at different size caps
+
+Without --live the upload time is estimated from --uplink-mbps and the
+model time is left out; with --live (and GOOGLE_API_KEY set) each variant
+is sent to Gemini and the real round trip is measured.
+
+Usage: python benchmarks/bench_preprocess.py [photo.jpg] [--caps 0,2048,1536,1024,768]
+"""
+
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+from image_pipeline import preprocess_image
+
+
+def synthetic_photo(width=4000, height=3000):
+    """A 12 MP JPEG with enough texture to compress like a real photo."""
+    size = (width, height)
+    image = Image.merge("RGB", [
+        Image.effect_noise(size, 40),
+        Image.linear_gradient("L").resize(size),
+        Image.radial_gradient("L").resize(size)
+    ])
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def time_live_call(blob):
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.environ["GOOGLE_API_KEY"])
+    model = genai.GenerativeModel("gemini-1.5-flash")
+    start = time.perf_counter()
+    model.generate_content(["Name the item in this photo in five words.", blob])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("photo", nargs="?", help="image file (default: synthetic 12 MP JPEG)")
+    parser.add_argument("--caps", default="0,2048,1536,1024,768",
+                        help="comma-separated max edge lengths, 0 = original size")
+    parser.add_argument("--format", default="JPEG", choices=["JPEG", "WEBP"])
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--uplink-mbps", type=float, default=10.0)
+    parser.add_argument("--live", action="store_true", help="also time real Gemini calls")
+    args = parser.parse_args()
+
+    if args.photo:
+        with open(args.photo, "rb") as f:
+            source = f.read()
+    else:
+        source = synthetic_photo()
+
+    print(f"Source: {len(source) / 1024:.0f} KB, {Image.open(io.BytesIO(source)).size}")
+    print(f"{'cap':>6} {'output':>12} {'bytes':>9} {'saved':>7} {'prep ms':>8} "
+          f"{'upload ms':>10} {'model ms':>9} {'total ms':>9}")
+
+    for cap in [int(c) for c in args.caps.split(",")]:
+        prep_times = []
+        live_times = []
+        for _ in range(args.repeat):
+            result = preprocess_image(
+                Image.open(io.BytesIO(source)),
+                max_edge=cap,
+                image_format=args.format,
+                quality=args.quality,
+                original_bytes=len(source)
+            )
+            prep_times.append(result["stats"]["total_ms"])
+            if args.live:
+                live_times.append(time_live_call(result["blob"]) * 1000)
+
+        stats = result["stats"]
+        prep_ms = statistics.median(prep_times)
+        upload_ms = stats["output_bytes"] * 8 / (args.uplink_mbps * 1e6) * 1000
+        model_ms = statistics.median(live_times) if live_times else 0.0
+        width, height = stats["output_size"]
+
+        print(f"{cap or 'orig':>6} {f'{width}x{height}':>12} {stats['output_bytes']:>9} "
+              f"{stats['bytes_saved'] / len(source):>6.0%} {prep_ms:>8.1f} "
+              f"{upload_ms:>10.1f} {model_ms if live_times else float('nan'):>9.1f} "
+              f"{prep_ms + upload_ms + model_ms:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
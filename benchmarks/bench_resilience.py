@@ -0,0 +1,71 @@
+"""
+ValueAI - Gemini Call Resilience Benchmark
+Runs the retry/deadline/hedging layer against the local fake model
+
+Usage: python benchmarks/bench_resilience.py [--calls 400] [--failure-rate 0.1] [--hedge]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import metrics
+from fake_gemini import FakeGenerativeModel
+from resilience import call_with_resilience, latency_summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="median fake latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.6, help="lognormal latency spread")
+    parser.add_argument("--failure-rate", type=float, default=0.1)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    parser.add_argument("--hedge", action="store_true")
+    args = parser.parse_args()
+
+    model = FakeGenerativeModel(args.latency, args.sigma, args.failure_rate, seed=42)
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            call_with_resilience(
+                lambda: model.generate_content(["x"], request_options={"timeout": args.deadline}).text,
+                deadline=args.deadline,
+                hedge=args.hedge
+            )
+            return True, time.perf_counter() - start
+        except Exception:
+            return False, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        outcomes = list(pool.map(one, range(args.calls)))
+    elapsed = time.perf_counter() - start
+
+    succeeded = sorted(seconds for ok, seconds in outcomes if ok)
+    summary = latency_summary()
+    counters = metrics.snapshot()
+
+    def pct(q):
+        return succeeded[min(len(succeeded) - 1, int(len(succeeded) * q / 100))] * 1000
+
+    print(f"{args.calls} calls in {elapsed:.1f} s, {len(succeeded)} succeeded, "
+          f"{model.calls} model requests")
+    print(f"end-to-end  p50 {pct(50):7.1f} ms   p99 {pct(99):7.1f} ms")
+    print(f"per-attempt p50 {summary['p50'] * 1000:7.1f} ms   p99 {summary['p99'] * 1000:7.1f} ms")
+    win_rate = summary["hedge_win_rate"]
+    print(f"retries {counters.get('gemini_retries_total', 0)}, "
+          f"deadlines {counters.get('gemini_deadline_exceeded_total', 0)}, "
+          f"hedges {summary['hedges']}, "
+          f"hedge win-rate {'-' if win_rate is None else f'{win_rate:.0%}'}")
+
+
+if __name__ == "__main__":
+    main()
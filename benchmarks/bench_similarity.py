@@ -0,0 +1,63 @@
+"""
+ValueAI - Similar Item Index Benchmark
+Times near-duplicate lookups against a large perceptual-hash index
+
+Usage: python benchmarks/bench_similarity.py [--entries 1000000] [--distances 0,3,6,10]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from similar_items import SimilarItemIndex
+
+
+def flip_bits(value, bits):
+    for position in random.sample(range(64), bits):
+        value ^= 1 << position
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--entries", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--distances", default="0,3,6,10")
+    args = parser.parse_args()
+
+    random.seed(42)
+    hashes = [random.getrandbits(64) for _ in range(args.entries)]
+
+    index = SimilarItemIndex(":memory:")
+    start = time.perf_counter()
+    index.add_many((h, {}) for h in hashes)
+    print(f"Indexed {len(index)} hashes in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    index.add(random.getrandbits(64), {"item_name": "incremental"})
+    print(f"Incremental insert: {(time.perf_counter() - start) * 1e6:.0f} us")
+
+    print(f"{'radius':>6} {'p50 us':>8} {'p99 us':>8} {'recall':>7}")
+    for radius in [int(d) for d in args.distances.split(",")]:
+        timings = []
+        found = 0
+        for _ in range(args.queries):
+            target = random.choice(hashes)
+            query = flip_bits(target, random.randint(0, radius))
+            start = time.perf_counter()
+            matches = index.search(query, max_distance=radius)
+            timings.append((time.perf_counter() - start) * 1e6)
+            found += any(distance == (query ^ target).bit_count() for distance, _ in matches)
+
+        timings.sort()
+        print(f"{radius:>6} {statistics.median(timings):>8.0f} "
+              f"{timings[int(len(timings) * 0.99)]:>8.0f} {found / args.queries:>7.1%}")
+
+
+if __name__ == "__main__":
+    main()
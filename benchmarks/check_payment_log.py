@@ -0,0 +1,125 @@
+"""
+ValueAI - Payment Log Check
+Verifies that a deployment with only the legacy payment_log.json is read correctly
+
+Creates a legacy log in a temporary directory and checks that every
+reader (rollups, recent payments, session lookup, follower) sees its
+entries before anything new is appended, and that rebuild-rollups
+finishes. Exits with status 1 on failure.
+
+Usage: python benchmarks/check_payment_log.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import payment_log
+
+LEGACY_ENTRIES = [
+    {"license_key": "VAI-LEGACY-1", "timestamp": "2024-02-01T10:00:00", "email": "a@example.com",
+     "amount_eur": 20.0, "credits": 50, "plan_id": "professional", "session_id": "cs_legacy_1"},
+    {"license_key": "VAI-LEGACY-2", "timestamp": "2024-02-02T11:30:00", "email": "b@example.org",
+     "amount_eur": 5.0, "credits": 10, "plan_id": "starter"}
+]
+
+JSONL_ENTRY = {"license_key": "VAI-JSONL-1", "timestamp": "2024-03-01T09:00:00", "email": "c@example.com",
+               "amount_eur": 20.0, "credits": 50, "plan_id": "professional", "session_id": "cs_jsonl_1"}
+
+# Seconds before a reader that never returns (e.g. a self-deadlock) counts as failed
+READER_TIMEOUT = 10
+
+
+def reset_module():
+    """Fresh per-process state, as in a newly started app."""
+    payment_log._converted = False
+    payment_log._sessions.clear()
+    payment_log._sessions_follower = payment_log.PaymentLogFollower()
+
+
+def run_with_timeout(reader):
+    """reader() in a daemon thread; "timed out" if it does not return in time."""
+    result = ["timed out"]
+
+    def run():
+        result[0] = reader()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(READER_TIMEOUT)
+    return result[0]
+
+
+def check(name, reader, expected, jsonl_entries=()):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            with open(payment_log.LEGACY_PAYMENT_LOG_FILE, "w") as f:
+                json.dump(LEGACY_ENTRIES, f)
+            if jsonl_entries:
+                with open(payment_log.PAYMENT_LOG_FILE, "w") as f:
+                    for entry in jsonl_entries:
+                        f.write(json.dumps(entry) + "\n")
+            reset_module()
+            actual = run_with_timeout(reader)
+        finally:
+            os.chdir(cwd)
+            reset_module()
+
+    ok = actual == expected
+    print(f"  {'ok  ' if ok else 'FAIL'} {name}: {actual!r}")
+    return ok
+
+
+def main():
+    print("Legacy-only payment log:")
+    results = [
+        check(
+            "load_rollups totals",
+            lambda: payment_log.load_rollups()["totals"],
+            {"transactions": 2, "revenue_cents": 2500, "credits": 60}
+        ),
+        check(
+            "load_rollups by_plan",
+            lambda: sorted(payment_log.load_rollups()["by_plan"]),
+            ["professional", "starter"]
+        ),
+        check(
+            "recent_payments",
+            lambda: [e["license_key"] for e in payment_log.recent_payments(10)],
+            ["VAI-LEGACY-1", "VAI-LEGACY-2"]
+        ),
+        check(
+            "find_session",
+            lambda: (payment_log.find_session("cs_legacy_1") or {}).get("license_key"),
+            "VAI-LEGACY-1"
+        ),
+        check(
+            "PaymentLogFollower",
+            lambda: len(payment_log.PaymentLogFollower().read()[1]),
+            2
+        ),
+        check(
+            "rebuild_rollups",
+            lambda: payment_log.rebuild_rollups()[0]["totals"],
+            {"transactions": 2, "revenue_cents": 2500, "credits": 60}
+        ),
+        check(
+            "rebuild_rollups with a JSONL log",
+            lambda: payment_log.rebuild_rollups()[0]["totals"],
+            {"transactions": 3, "revenue_cents": 4500, "credits": 110},
+            jsonl_entries=[JSONL_ENTRY]
+        )
+    ]
+
+    if not all(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+ValueAI - Fake Gemini Model
+Local stand-in for genai.GenerativeModel with configurable latency and errors
+
+Install it with appraiser.use_model(FakeGenerativeModel(...)).
+"""
+
+import json
+import random
+import threading
+import time
+
+FAKE_VALUATION = {
+    "item_name": "Vintage Leica M3 Camera",
+    "condition": "Good - light wear on the top plate",
+    "price_new": 2500,
+    "price_used_fast": 900,
+    "price_collector": 1400,
+    "description": "Classic rangefinder in working order. A sought-after body for collectors and film photographers alike."
+}
+
+
+class FakeAPIError(Exception):
+    """Mimics google.api_core errors, which carry the HTTP status in .code."""
+
+    def __init__(self, code, message="fake error"):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Answers generate_content() with a fixed valuation after a lognormal
+    latency (median latency_median seconds, spread latency_sigma); a
+    failure_rate fraction of calls raise a 429 or 503 instead.
+    """
+
+    def __init__(self, latency_median=1.5, latency_sigma=0.5, failure_rate=0.0,
+                 valuation=None, chunks=6, seed=None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.text = json.dumps(valuation or FAKE_VALUATION)
+        self.chunks = chunks
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            self.calls += 1
+            latency = self.latency_median * self._random.lognormvariate(0, self.latency_sigma)
+            failed = self._random.random() < self.failure_rate
+            code = self._random.choice((429, 503))
+        return latency, failed, code
+
+    def generate_content(self, contents, stream=False, request_options=None, **kwargs):
+        latency, failed, code = self._draw()
+        timeout = (request_options or {}).get("timeout")
+
+        if stream:
+            return self._stream(latency, failed, code, timeout)
+
+        time.sleep(min(latency, timeout) if timeout else latency)
+        if timeout and latency > timeout:
+            raise FakeAPIError(504, "deadline exceeded")
+        if failed:
+            raise FakeAPIError(code)
+        return FakeResponse(self.text)
+
+    def _stream(self, latency, failed, code, timeout):
+        # Half the latency before the first chunk, the rest spread over chunks
+        time.sleep(latency / 2)
+        if failed:
+            raise FakeAPIError(code)
+        size = -(-len(self.text) // self.chunks)
+        for i in range(0, len(self.text), size):
+            yield FakeResponse(self.text[i:i + size])
+            time.sleep(latency / 2 / self.chunks)
+
+    def count_tokens(self, contents):
+        return {"total_tokens": 0}
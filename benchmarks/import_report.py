@@ -0,0 +1,134 @@
+"""
+ValueAI - Import-Time Report
+Measures what a fresh process imports before the app can render its first page
+
+Runs `python -X importtime -c "import <modules>"` in new interpreters,
+prints the slowest top-level imports (median over --runs) and writes the
+results as JSON. Exits with status 1 if a heavy SDK that should only be
+loaded on first use is imported at startup, or, given --baseline, if the
+total got slower than --max-ratio times the baseline.
+
+Usage: python benchmarks/import_report.py [--modules app_modules] [--runs 5] [--top 15]
+                                          [--output import_report.json] [--baseline old.json --max-ratio 1.5]
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What app.py imports before st.set_page_config (app.py itself runs the UI)
+APP_MODULES = [
+    "streamlit", "appraiser", "batch", "image_pipeline", "valuation",
+    "valuation_cache", "similar_items", "metrics", "payments", "credit_store"
+]
+ADMIN_MODULES = ["streamlit", "metrics", "credit_store", "payment_log", "webhook_server"]
+
+# Loaded on first use; importing them at startup is a regression
+LAZY_MODULES = ["google.generativeai", "stripe", "pandas", "PIL"]
+
+
+def run_once(modules):
+    """One fresh interpreter; returns (wall seconds, [(depth, name, self_us, cumulative_us)])."""
+    command = [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)]
+    start = time.perf_counter()
+    process = subprocess.run(command, cwd=APP_DIR, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        print(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "import failed")
+        sys.exit(2)
+
+    imports = []
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return wall, imports
+
+
+def build_report(modules, runs):
+    walls = []
+    top_level = {}
+    imported = set()
+    for _ in range(runs):
+        wall, imports = run_once(modules)
+        walls.append(wall)
+        for depth, name, _, cumulative_us in imports:
+            imported.add(name)
+            # The outermost entries are what the import statement paid for
+            if depth == 0:
+                top_level.setdefault(name, []).append(cumulative_us)
+
+    cumulative = {name: statistics.median(values) / 1000 for name, values in top_level.items()}
+    lazy_violations = [
+        name for name in LAZY_MODULES
+        if any(m == name or m.startswith(name + ".") for m in imported)
+    ]
+    return {
+        "modules": modules,
+        "runs": runs,
+        "wall_ms": statistics.median(walls) * 1000,
+        "imports_ms": sum(cumulative.values()),
+        "module_count": len(imported),
+        "top_level_ms": dict(sorted(cumulative.items(), key=lambda item: -item[1])),
+        "lazy_violations": lazy_violations
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--modules", default="app", help="app, admin or a comma-separated module list")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", default="import_report.json")
+    parser.add_argument("--baseline", help="earlier output to compare against")
+    parser.add_argument("--max-ratio", type=float, default=1.5)
+    args = parser.parse_args()
+
+    modules = {"app": APP_MODULES, "admin": ADMIN_MODULES}.get(args.modules)
+    modules = modules or args.modules.split(",")
+
+    report = build_report(modules, args.runs)
+    print(f"Process start to imports done: {report['wall_ms']:.0f} ms "
+          f"({report['imports_ms']:.0f} ms importing {report['module_count']} modules, median of {args.runs})")
+    for name, ms in list(report["top_level_ms"].items())[:args.top]:
+        print(f"  {name:<40} {ms:8.1f} ms")
+
+    report.update({
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform()
+    })
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    failed = False
+    if report["lazy_violations"]:
+        print(f"Imported at startup but should load on first use: {', '.join(report['lazy_violations'])}")
+        failed = True
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            before = json.load(f)["imports_ms"]
+        ratio = report["imports_ms"] / before if before else 1.0
+        print(f"Compared with {args.baseline}: {before:.0f} -> {report['imports_ms']:.0f} ms  x{ratio:.2f}")
+        if ratio > args.max_ratio:
+            print(f"Startup imports regressed (max ratio {args.max_ratio})")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
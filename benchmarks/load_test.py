@@ -0,0 +1,232 @@
+"""
+ValueAI - Load Test
+Drives simulated user sessions against a local Gemini stand-in
+
+Each session follows the flow of app.main(): log in with a license key,
+upload a photo (preprocess + perceptual hash), reserve a credit, analyze,
+then commit or release the credit. Nothing leaves the machine: the model
+is benchmarks/fake_gemini.py and all state lives in a temporary directory.
+
+With --apptest, a number of sessions additionally log in through the real
+app.py script via Streamlit's AppTest (its file_uploader cannot be driven,
+so upload and analysis always go through the same functions main() calls).
+
+Usage: python benchmarks/load_test.py [--sessions 50] [--concurrency 20] [--failure-rate 0.02]
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def make_photo(seed, size=(1600, 1200)):
+    """A distinct noisy photo, so neither cache short-circuits the call."""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    small = Image.frombytes("RGB", (64, 48), bytes(rng.getrandbits(8) for _ in range(64 * 48 * 3)))
+    return small.resize(size, Image.BILINEAR)
+
+
+def run_session(index, analyses, credits, stream):
+    """One simulated user. Returns per-analysis latencies and the accounting."""
+    from appraiser import analyze_item_with_gemini
+    from credit_store import (
+        set_credits, get_credits, validate_license_key,
+        reserve_credit, commit_reservation, release_reservation
+    )
+    from image_pipeline import preprocess_image
+    from similar_items import dhash
+
+    license_key = f"LOAD-{index:05d}"
+    set_credits(license_key, credits)
+
+    # Login
+    is_valid, _ = validate_license_key(license_key)
+    if not is_valid:
+        return {"latencies": [], "charged": 0, "failed": 0, "refused": analyses,
+                "expected": credits, "actual": get_credits(license_key)}
+
+    latencies = []
+    charged = failed = refused = 0
+
+    for n in range(analyses):
+        start = time.perf_counter()
+
+        # Upload
+        processed = preprocess_image(make_photo(index * 1000 + n))
+        phash = dhash(processed["image"])
+
+        # Analyze and settle the credit
+        reservation = reserve_credit(license_key)
+        if reservation is None:
+            refused += 1
+            continue
+
+        result = analyze_item_with_gemini(
+            processed["blob"],
+            image_hash=phash,
+            on_field=(lambda key, value: None) if stream else None,
+            license_key=license_key
+        )
+        if result["success"] and commit_reservation(reservation):
+            charged += 1
+        else:
+            release_reservation(reservation)
+            failed += 1
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "latencies": latencies,
+        "charged": charged,
+        "failed": failed,
+        "refused": refused,
+        "expected": credits - charged,
+        "actual": get_credits(license_key)
+    }
+
+
+def run_apptest_logins(count):
+    """Log in through app.py with AppTest; returns seconds per login."""
+    from credit_store import set_credits
+    from streamlit.testing.v1 import AppTest
+
+    seconds = []
+    for index in range(count):
+        license_key = f"APPTEST-{index:05d}"
+        set_credits(license_key, 1)
+
+        start = time.perf_counter()
+        at = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=60)
+        at.secrets["GOOGLE_API_KEY"] = "load-test"
+        at.run()
+        at.text_input[0].input(license_key)
+        next(b for b in at.button if b.label == "🚀 Login").click()
+        at.run()
+
+        if at.exception or not at.session_state["authenticated"]:
+            raise RuntimeError(f"AppTest login failed for {license_key}: {at.exception}")
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions active at once")
+    parser.add_argument("--analyses", type=int, default=3, help="analyses per session")
+    parser.add_argument("--latency", type=float, default=1.5, help="median model latency (s)")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal latency spread")
+    parser.add_argument("--failure-rate", type=float, default=0.02)
+    parser.add_argument("--rpm", type=int, default=0, help="Gemini quota (0 = unlimited)")
+    parser.add_argument("--no-stream", action="store_true")
+    parser.add_argument("--apptest", type=int, default=0, metavar="N",
+                        help="also log in N sessions through app.py with AppTest")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so isolate state before importing
+    output = os.path.abspath(args.json) if args.json else None
+    workdir = tempfile.mkdtemp(prefix="valueai-load-")
+    os.chdir(workdir)
+    os.environ["GEMINI_RPM"] = str(args.rpm)
+    os.environ.setdefault("GEMINI_BACKOFF_BASE", "0.2")
+
+    import appraiser
+    import metrics
+    from fake_gemini import FakeGenerativeModel
+
+    model = FakeGenerativeModel(args.latency, args.sigma, args.failure_rate, seed=42)
+    appraiser.use_model(model)
+
+    # Every fourth session runs out of credits before its last analysis
+    def credits_for(index):
+        return args.analyses - 1 if index % 4 == 3 else args.analyses
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        sessions = list(pool.map(
+            lambda i: run_session(i, args.analyses, credits_for(i), not args.no_stream),
+            range(args.sessions)
+        ))
+    elapsed = time.perf_counter() - start
+
+    apptest_seconds = run_apptest_logins(args.apptest) if args.apptest else []
+
+    latencies = [s for session in sessions for s in session["latencies"]]
+    mismatches = sum(1 for s in sessions if s["expected"] != s["actual"])
+    # A refusal is only correct once the key's balance has reached zero
+    over_refused = sum(1 for s in sessions if s["refused"] and s["actual"] != 0)
+    charged = sum(s["charged"] for s in sessions)
+
+    report = {
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "analyses": len(latencies),
+        "charged": charged,
+        "failed": sum(s["failed"] for s in sessions),
+        "refused": sum(s["refused"] for s in sessions),
+        "model_requests": model.calls,
+        "seconds": round(elapsed, 2),
+        "throughput_per_s": round(charged / elapsed, 2),
+        "p50_s": round(percentile(latencies, 50), 3),
+        "p95_s": round(percentile(latencies, 95), 3),
+        "p99_s": round(percentile(latencies, 99), 3),
+        "credit_mismatches": mismatches,
+        "unexpected_refusals": over_refused,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "gemini_retries": metrics.get("gemini_retries_total"),
+        "apptest_logins": len(apptest_seconds),
+        "apptest_login_p50_s": round(percentile(apptest_seconds, 50), 3)
+    }
+
+    print(f"{report['sessions']} sessions ({report['concurrency']} concurrent), "
+          f"{report['analyses']} analyses in {report['seconds']} s")
+    print(f"  throughput  {report['throughput_per_s']} valuations/s "
+          f"({report['model_requests']} model requests, {report['gemini_retries']} retries)")
+    print(f"  latency     p50 {report['p50_s']} s   p95 {report['p95_s']} s   p99 {report['p99_s']} s")
+    print(f"  credits     {charged} charged, {report['failed']} failed, {report['refused']} refused, "
+          f"{mismatches} balance mismatches")
+    print(f"  peak RSS    {report['peak_rss_mb']} MB")
+    if apptest_seconds:
+        print(f"  AppTest     {len(apptest_seconds)} logins, p50 {report['apptest_login_p50_s']} s")
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    os.chdir(APP_DIR)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    # Accounting errors fail the run so they block a deploy
+    if mismatches or over_refused:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+ValueAI - Microbenchmarks
+Times credit, license and payment-log operations at realistic data sizes
+
+Seeds the credit store with 1k/100k/1M license keys and the payment log
+with 1M entries, times each operation and writes the results as JSON.
+Given --baseline, exits with status 1 if any operation's median got
+slower than --max-ratio times the baseline median.
+
+Usage: python benchmarks/microbench.py [--sizes 1000,100000,1000000] [--log-entries 1000000]
+                                       [--output microbench.json] [--baseline old.json --max-ratio 1.5]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import credit_store
+
+
+def measure(fn, budget, max_iterations=20000):
+    """Call fn until the time budget is spent (at least once); per-call stats."""
+    samples = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < max_iterations:
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+        if time.perf_counter() >= deadline:
+            break
+
+    samples.sort()
+    return {
+        "iterations": len(samples),
+        "mean_us": statistics.fmean(samples) * 1e6,
+        "p50_us": samples[len(samples) // 2] * 1e6,
+        "p99_us": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6,
+        "ops_per_s": len(samples) / sum(samples)
+    }
+
+
+def make_store(backend, workdir):
+    json_path = os.path.join(workdir, "credits.json")
+    if backend == "json":
+        return credit_store.JsonCreditStore(json_path)
+    if backend == "ledger":
+        return credit_store.LedgerCreditStore(json_path, os.path.join(workdir, "credits.log"))
+    return credit_store.SqliteCreditStore(os.path.join(workdir, "credits.db"), migrate_from=None)
+
+
+def bench_credits(results, backend, size, budget):
+    with tempfile.TemporaryDirectory() as workdir:
+        store = make_store(backend, workdir)
+        keys = [f"VAI-{i:07d}" for i in range(size)]
+        store.save({key: 1_000_000 for key in keys})
+
+        # The module-level API is what app.py calls
+        credit_store._store = store
+        pick = random.Random(42).choice
+
+        results[f"validate_license_key[{size}]"] = measure(
+            lambda: credit_store.validate_license_key(pick(keys)), budget
+        )
+        results[f"validate_license_key_missing[{size}]"] = measure(
+            lambda: credit_store.validate_license_key("VAI-NOT-A-KEY"), budget
+        )
+        results[f"deduct_credit[{size}]"] = measure(
+            lambda: credit_store.deduct_credit(pick(keys)), budget
+        )
+        # Admin license table: one page of a search, and the totals
+        results[f"search_licenses_prefix[{size}]"] = measure(
+            lambda: credit_store.search_licenses(pick(keys)[:8], 0, 51), budget
+        )
+        results[f"search_licenses_contains[{size}]"] = measure(
+            lambda: credit_store.search_licenses(pick(keys)[-5:], 0, 51, contains=True), budget
+        )
+        results[f"license_totals[{size}]"] = measure(credit_store.license_totals, budget)
+        credit_store._store = None
+
+
+def seed_payment_log(path, entries):
+    """Write a payment log of the given size in the current on-disk format (JSONL)."""
+    plans = ["starter", "professional", "business", "enterprise"]
+    rng = random.Random(7)
+    with open(path, "w") as f:
+        for i in range(entries):
+            f.write(json.dumps({
+                "license_key": f"VAI-{i:07d}",
+                "timestamp": datetime(2024, 1, 1).isoformat(),
+                "email": f"user{i}@example.com",
+                "amount_eur": 20.0,
+                "credits": 50,
+                "plan_id": rng.choice(plans)
+            }, separators=(",", ":")) + "\n")
+
+
+def bench_payments(results, entries, budget):
+    try:
+        from payments import generate_license_key, log_payment
+    except ImportError as e:
+        print(f"Skipping payment benchmarks: {e}")
+        return
+    try:
+        from admin import load_payment_log
+    except ImportError as e:
+        print(f"Skipping admin benchmarks: {e}")
+        load_payment_log = None
+
+    results["generate_license_key"] = measure(generate_license_key, budget)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # Both modules use paths relative to the working directory
+        os.chdir(workdir)
+        try:
+            seed_payment_log("payment_log.jsonl", entries)
+            payment = {"email": "bench@example.com", "amount": 20.0, "credits": 50, "plan_id": "professional"}
+
+            results[f"log_payment[{entries}]"] = measure(
+                lambda: log_payment(generate_license_key(), payment), budget
+            )
+            if load_payment_log is not None:
+                results[f"load_payment_log[{entries}]"] = measure(
+                    lambda: sum(1 for _ in load_payment_log()), budget
+                )
+        finally:
+            os.chdir(cwd)
+
+
+def compare(results, baseline, max_ratio):
+    """Print median ratios against a baseline; return the regressed names."""
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        ratio = stats["p50_us"] / before["p50_us"] if before["p50_us"] else 1.0
+        flag = "REGRESSION" if ratio > max_ratio else ""
+        print(f"  {name:<40} {before['p50_us']:12.1f} -> {stats['p50_us']:12.1f} us  x{ratio:5.2f} {flag}")
+        if ratio > max_ratio:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[1])
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="license keys to seed")
+    parser.add_argument("--log-entries", type=int, default=1000000)
+    parser.add_argument("--backend", default=credit_store.CREDITS_BACKEND,
+                        choices=["sqlite", "ledger", "json"])
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds per operation")
+    parser.add_argument("--output", default="microbench.json")
+    parser.add_argument("--baseline", help="earlier output to compare against")
+    parser.add_argument("--max-ratio", type=float, default=1.5)
+    args = parser.parse_args()
+
+    results = {}
+    for size in (int(s) for s in args.sizes.split(",")):
+        bench_credits(results, args.backend, size, args.budget)
+    bench_payments(results, args.log_entries, args.budget)
+
+    for name, stats in results.items():
+        print(f"{name:<42} p50 {stats['p50_us']:12.1f} us   p99 {stats['p99_us']:12.1f} us   "
+              f"{stats['ops_per_s']:10.0f} ops/s")
+
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": args.backend,
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["results"]
+        print(f"Compared with {args.baseline} (max ratio {args.max_ratio}):")
+        regressions = compare(results, baseline, args.max_ratio)
+        if regressions:
+            print(f"{len(regressions)} operation(s) regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+ValueAI - Prompt Token Report
+Compares per-call input tokens of the old inline prompt with the shared
+system-instruction model from appraiser.py
+
+Needs GOOGLE_API_KEY (count_tokens is free but goes over the network).
+
+Usage: python benchmarks/token_report.py [photo.jpg]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+
+import appraiser
+from image_pipeline import preprocess_image
+
+
+def main():
+    appraiser.configure_gemini(os.environ.get("GOOGLE_API_KEY"))
+
+    if len(sys.argv) > 1:
+        image = Image.open(sys.argv[1])
+    else:
+        image = Image.new("RGB", (1024, 768), (180, 140, 90))
+    blob = preprocess_image(image)["blob"]
+
+    instructions = appraiser.PROMPTS[appraiser.PROMPT_VERSION]
+    inline_prompt = instructions + "\n\n" + appraiser.REQUEST_TEXT
+
+    plain_model = appraiser.get_genai().GenerativeModel(appraiser.GEMINI_MODEL)
+    shared_model = appraiser.get_model()
+
+    legacy = plain_model.count_tokens([inline_prompt, blob]).total_tokens
+    instruction_only = plain_model.count_tokens(instructions).total_tokens
+    request_only = plain_model.count_tokens([appraiser.REQUEST_TEXT, blob]).total_tokens
+    shared = shared_model.count_tokens([appraiser.REQUEST_TEXT, blob]).total_tokens
+    cached_context = getattr(shared_model, "cached_content", None) is not None
+
+    print(f"Model: {appraiser.GEMINI_MODEL}, prompt {appraiser.PROMPT_VERSION}")
+    print(f"Old inline prompt + image:          {legacy:6d} tokens per call")
+    print(f"Appraiser instructions alone:       {instruction_only:6d} tokens")
+    print(f"Per-call request text + image:      {request_only:6d} tokens")
+    print(f"Shared model request (as counted):  {shared:6d} tokens")
+    print(f"Per-call content reduction:         {legacy - request_only:6d} tokens "
+          f"({(legacy - request_only) / legacy:.0%})")
+    if cached_context:
+        print("Instructions are served from a Gemini context cache.")
+    else:
+        print("Instructions travel as a system instruction and are still billed as "
+              "input per call; enable GEMINI_CONTEXT_CACHE to cache them where the "
+              "model's minimum cache size allows.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+ValueAI - Bulk Appraiser
+Headless command-line valuation of a directory of photos
+
+Writes one JSON line per image to the output file. The output doubles as
+the checkpoint: images that already have a successful line are skipped,
+so an interrupted run can simply be started again without re-billing.
+
+Usage:
+    python bulk_appraise.py PHOTO_DIR --license-key KEY [--output results.jsonl] [--workers 8]
+
+GOOGLE_API_KEY is read from the environment or .streamlit/secrets.toml.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+
+from appraiser import configure_gemini
+from batch import appraise_batch, NO_CREDITS_ERROR, BATCH_MAX_WORKERS
+from credit_store import get_credits
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def find_images(directory):
+    """All image files below directory, as sorted relative paths."""
+    found = []
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(root, file), directory))
+    return sorted(found)
+
+
+def load_checkpoint(output_path):
+    """Relative paths that already have a successful result line."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # Torn last line from an interrupted run
+                continue
+            if entry.get("success"):
+                done.add(entry["file"])
+    return done
+
+
+class ResultWriter:
+    """Appends fsync'd JSON lines from many worker threads."""
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def __call__(self, result):
+        entry = {
+            "file": result["name"],
+            "success": result["success"],
+            "cached": result.get("cached", False),
+            "billable": result.get("billable", False),
+            "seconds": round(result["seconds"], 3),
+            "timestamp": datetime.now().isoformat()
+        }
+        if result["success"]:
+            entry["data"] = result["data"].to_dict()
+        else:
+            entry["error"] = result.get("error")
+
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def print_summary(results, elapsed, skipped):
+    succeeded = [r for r in results if r["success"]]
+    latencies = sorted(r["seconds"] for r in results if r["seconds"])
+
+    print()
+    print(f"Processed:   {len(results)} images in {elapsed:.1f} s ({skipped} skipped from checkpoint)")
+    print(f"Succeeded:   {len(succeeded)} ({sum(1 for r in succeeded if r.get('cached'))} from cache)")
+    print(f"Failed:      {len(results) - len(succeeded)}")
+    print(f"Charged:     {sum(1 for r in results if r.get('charged'))} credits")
+    if elapsed > 0:
+        print(f"Throughput:  {len(results) / elapsed:.2f} images/s")
+    if latencies:
+        print(f"Latency:     p50 {statistics.median(latencies):.2f} s, "
+              f"p95 {percentile(latencies, 0.95):.2f} s, "
+              f"p99 {percentile(latencies, 0.99):.2f} s, "
+              f"max {latencies[-1]:.2f} s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Appraise every photo in a directory.")
+    parser.add_argument("directory")
+    parser.add_argument("--license-key", required=True)
+    parser.add_argument("--output", default="results.jsonl")
+    parser.add_argument("--workers", type=int, default=BATCH_MAX_WORKERS)
+    args = parser.parse_args(argv)
+
+    license_key = args.license_key.strip().upper()
+    if get_credits(license_key) is None:
+        print(f"Unknown license key: {license_key}")
+        return 2
+
+    configure_gemini()
+
+    done = load_checkpoint(args.output)
+    todo = [path for path in find_images(args.directory) if path not in done]
+    print(f"{len(todo)} images to appraise, {len(done)} already done, "
+          f"{get_credits(license_key)} credits on {license_key}")
+
+    writer = ResultWriter(args.output)
+    results = []
+    start = time.perf_counter()
+    out_of_credits = False
+
+    def items():
+        # Stop submitting once a credit was refused; images already started still finish
+        for path in todo:
+            if out_of_credits:
+                return
+            yield path, os.path.join(args.directory, path)
+
+    try:
+        for result in appraise_batch(items(), license_key, args.workers, record=writer):
+            if result.get("error") == NO_CREDITS_ERROR:
+                # Refused before any work: not charged, not written, retried on resume
+                if not out_of_credits:
+                    print("Out of credits - finishing images already started.")
+                out_of_credits = True
+                continue
+            results.append(result)
+            status = "ok" if result["success"] else f"failed: {result.get('error')}"
+            print(f"[{len(results)}/{len(todo)}] {result['name']} {status} ({result['seconds']:.1f} s)")
+    except KeyboardInterrupt:
+        print("Interrupted - run the same command again to resume.")
+    finally:
+        writer.close()
+
+    if out_of_credits:
+        print("Out of credits - top up the key and run again to resume.")
+    print_summary(results, time.perf_counter() - start, len(done))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
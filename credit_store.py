@@ -0,0 +1,985 @@
+"""
+ValueAI - Credit Storage
+License key and credit storage shared by app.py, admin.py and payments.py
+"""
+
+import bisect
+import contextlib
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import metrics
+from settings import get_setting
+
+try:
+    import fcntl
+except ImportError:  # Windows: the ledger is only guarded within the process
+    fcntl = None
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+CREDITS_FILE = "credits.json"
+CREDITS_LOG_FILE = "credits.log"
+CREDITS_DB_FILE = "credits.db"
+
+# "sqlite" keeps credits in credits.db (safe across processes),
+# "ledger" appends one record per change to credits.log,
+# "json" rewrites credits.json on every change
+CREDITS_BACKEND = get_setting("CREDITS_BACKEND", "sqlite")
+
+# Fold the ledger into a new snapshot once it holds this many records
+LEDGER_COMPACT_AFTER = get_setting("LEDGER_COMPACT_AFTER", 10000)
+
+# Seconds before an uncommitted credit reservation is given back
+RESERVATION_TTL = get_setting("RESERVATION_TTL", 300)
+
+DEFAULT_CREDITS = {
+    "DEMO-KEY": 3,
+    "CLIENT-100": 50,
+    "PREMIUM-2024": 100,
+    "TEST-KEY": 10
+}
+
+# Ledger records are fixed-size ASCII lines:
+#   op (1) + " " + key (40) + " " + value (11) + " " + unix time (10) + "\n"
+# op is "D" (add value), "S" (set to value) or "X" (delete key)
+LEDGER_KEY_WIDTH = 40
+LEDGER_RECORD_SIZE = 66
+
+# Values must stay below this in magnitude to fit the signed 11-character field
+LEDGER_VALUE_LIMIT = 10 ** 10
+
+
+def _file_signature(path):
+    """(inode, mtime, size) of path, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _write_json_atomic(path, data):
+    """Write JSON to a temp file and move it over path."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _match_keys(sorted_keys, query, offset, limit, contains=False):
+    """One page of the keys that start with (or contain) query."""
+    if contains and query:
+        matches = (key for key in sorted_keys if query in key)
+    else:
+        # Keys sharing a prefix are adjacent in sorted order
+        start = bisect.bisect_left(sorted_keys, query)
+        matches = (sorted_keys[i] for i in range(start, len(sorted_keys)))
+        matches = itertools.takewhile(lambda key: key.startswith(query), matches)
+    return list(itertools.islice(matches, offset, offset + limit))
+
+
+# ============================================================================
+# JSON SNAPSHOT STORE
+# ============================================================================
+
+class JsonCreditStore:
+    """
+    Keeps every license in credits.json and rewrites it on each change.
+
+    The parsed file is held in memory and shared by every session in the
+    process. It is only re-parsed when the file's inode, mtime or size
+    changes, and writes go through the cache so they never force a reload.
+    """
+
+    def __init__(self, path=CREDITS_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._credits = None
+        self._snapshot_sig = None
+        self._index = None
+        self._reservations = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _read_snapshot(self):
+        if not os.path.exists(self.path):
+            _write_json_atomic(self.path, DEFAULT_CREDITS)
+            return dict(DEFAULT_CREDITS)
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _reload_snapshot(self):
+        self._credits = self._read_snapshot()
+        self._snapshot_sig = _file_signature(self.path)
+        self._index = None
+
+    def _refresh(self):
+        if self._credits is not None and _file_signature(self.path) == self._snapshot_sig:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            self._reload_snapshot()
+
+    def load(self):
+        """Return a {license_key: credits} dict."""
+        with self._lock:
+            self._refresh()
+            return dict(self._credits)
+
+    def save(self, credits):
+        """Replace the stored credits with the given dict."""
+        with self._lock:
+            _write_json_atomic(self.path, credits)
+            self._credits = dict(credits)
+            self._snapshot_sig = _file_signature(self.path)
+            self._index = None
+            return True
+
+    def get(self, key):
+        """Return the credits for key, or None if the key is unknown."""
+        with self._lock:
+            self._refresh()
+            return self._credits.get(key)
+
+    def set(self, key, credits):
+        with self._lock:
+            data = self.load()
+            data[key] = credits
+            return self.save(data)
+
+    def add(self, key, amount):
+        with self._lock:
+            data = self.load()
+            data[key] = data.get(key, 0) + amount
+            return self.save(data)
+
+    def delete(self, key):
+        with self._lock:
+            data = self.load()
+            if key not in data:
+                return False
+            del data[key]
+            return self.save(data)
+
+    def deduct(self, key):
+        """Take one credit from key if it has any left."""
+        with self._lock:
+            data = self.load()
+            if data.get(key, 0) > 0:
+                data[key] -= 1
+                return self.save(data)
+            return False
+
+    # -- admin queries -------------------------------------------------------
+    # Every write already rewrites the whole file, so the sorted keys and
+    # totals are simply rebuilt on the next query after a change.
+
+    def _key_index(self):
+        if self._index is None:
+            self._index = (sorted(self._credits), len(self._credits), sum(self._credits.values()))
+        return self._index
+
+    def search(self, query="", offset=0, limit=50, contains=False):
+        """Page of (license_key, credits) starting with or containing query."""
+        with self._lock:
+            self._refresh()
+            keys = _match_keys(self._key_index()[0], query, offset, limit, contains)
+            return [(key, self._credits[key]) for key in keys]
+
+    def totals(self):
+        """(number of licenses, total credits)."""
+        with self._lock:
+            self._refresh()
+            return self._key_index()[1:]
+
+    # -- reservations --------------------------------------------------------
+    # A reservation takes the credit up front so the balance never shows
+    # credits that are already promised to a running analysis. Holds are
+    # kept in memory, so a restart keeps any credits that were in flight.
+
+    def reserve(self, key, ttl=RESERVATION_TTL):
+        """Hold one credit for key. Returns a reservation id or None."""
+        with self._lock:
+            self.expire_reservations()
+            if not self.deduct(key):
+                return None
+            reservation_id = uuid.uuid4().hex
+            self._reservations[reservation_id] = (key, time.time() + ttl)
+            return reservation_id
+
+    def commit(self, reservation_id):
+        """Keep a held credit. False if the reservation already expired."""
+        with self._lock:
+            return self._reservations.pop(reservation_id, None) is not None
+
+    def release(self, reservation_id):
+        """Give a held credit back to its key."""
+        with self._lock:
+            reservation = self._reservations.pop(reservation_id, None)
+            if reservation is None:
+                return False
+            return self.add(reservation[0], 1)
+
+    def expire_reservations(self, now=None):
+        """Release every reservation past its deadline."""
+        now = now or time.time()
+        with self._lock:
+            expired = [rid for rid, (_, expires_at) in self._reservations.items()
+                       if expires_at < now]
+            for reservation_id in expired:
+                self.release(reservation_id)
+            return len(expired)
+
+
+# ============================================================================
+# APPEND-ONLY LEDGER STORE
+# ============================================================================
+
+class LedgerCreditStore(JsonCreditStore):
+    """
+    Uses credits.json as a snapshot plus an append-only log of fixed-size
+    records. Balances are kept in memory and refreshed by replaying only the
+    part of the log written since the last read. A background thread folds
+    the log into a new snapshot once it grows past LEDGER_COMPACT_AFTER.
+
+    Every process locks credits.log.lock around the log: exclusively to
+    check and append or to compact, shared to replay it.
+    """
+
+    def __init__(self, path=CREDITS_FILE, log_path=CREDITS_LOG_FILE,
+                 compact_after=LEDGER_COMPACT_AFTER):
+        super().__init__(path)
+        self.log_path = log_path
+        self.lock_path = f"{log_path}.lock"
+        self.compact_after = compact_after
+        self._log_offset = 0
+        self._lock_fd = None
+        self._compacting = False
+        self.stats["tail_replays"] = 0
+
+    @contextlib.contextmanager
+    def _file_lock(self, shared=False):
+        """Thread lock plus the cross-process flock; a no-op when re-entered."""
+        with self._lock:
+            if self._lock_fd is not None:
+                yield
+                return
+
+            fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                self._lock_fd = fd
+                yield
+            finally:
+                self._lock_fd = None
+                os.close(fd)
+
+    # -- reading -------------------------------------------------------------
+
+    def _replay(self, data):
+        """Apply log records from the current offset to the end of the log."""
+        try:
+            with open(self.log_path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                end = f.tell()
+                if end < self._log_offset:
+                    return False
+                f.seek(self._log_offset)
+                tail = f.read(end - self._log_offset)
+        except FileNotFoundError:
+            return self._log_offset == 0
+
+        # Ignore a partially written trailing record
+        usable = len(tail) - len(tail) % LEDGER_RECORD_SIZE
+        for start in range(0, usable, LEDGER_RECORD_SIZE):
+            record = tail[start:start + LEDGER_RECORD_SIZE].decode('ascii')
+            op = record[0]
+            key = record[2:2 + LEDGER_KEY_WIDTH].rstrip()
+            value = int(record[3 + LEDGER_KEY_WIDTH:14 + LEDGER_KEY_WIDTH])
+
+            if op == "D":
+                data[key] = data.get(key, 0) + value
+            elif op == "S":
+                data[key] = value
+            elif op == "X":
+                data.pop(key, None)
+
+        if usable:
+            self._index = None
+        self._log_offset += usable
+        return True
+
+    def _reload_snapshot(self):
+        super()._reload_snapshot()
+        self._log_offset = 0
+
+    def _refresh(self):
+        # Shared lock: never see a new snapshot next to the log it replaced
+        with self._file_lock(shared=True):
+            offset = self._log_offset
+            super()._refresh()
+
+            if not self._replay(self._credits):
+                # The log was compacted by another process; start over
+                self.stats["misses"] += 1
+                self._reload_snapshot()
+                self._replay(self._credits)
+            elif self._log_offset != offset:
+                self.stats["tail_replays"] += 1
+
+    # -- writing -------------------------------------------------------------
+
+    def _append(self, op, key, value):
+        if (len(key) > LEDGER_KEY_WIDTH or key != key.strip() or not key.isascii()
+                or abs(value) >= LEDGER_VALUE_LIMIT):
+            # Keys or values that do not fit a record go straight into the snapshot
+            data = self.load()
+            if op == "D":
+                data[key] = data.get(key, 0) + value
+            elif op == "S":
+                data[key] = value
+            else:
+                data.pop(key, None)
+            return self.save(data)
+
+        record = f"{op} {key:<{LEDGER_KEY_WIDTH}} {value:+011d} {int(time.time()):010d}\n"
+        fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, record.encode('ascii'))
+        finally:
+            os.close(fd)
+
+        self._replay(self._credits)
+        self._maybe_compact()
+        return True
+
+    def set(self, key, credits):
+        with self._file_lock():
+            self._refresh()
+            return self._append("S", key, int(credits))
+
+    def add(self, key, amount):
+        with self._file_lock():
+            self._refresh()
+            return self._append("D", key, int(amount))
+
+    def delete(self, key):
+        with self._file_lock():
+            self._refresh()
+            if key not in self._credits:
+                return False
+            return self._append("X", key, 0)
+
+    def deduct(self, key):
+        # The balance check and the append happen under one exclusive lock,
+        # so processes cannot overdraw a key between them
+        with self._file_lock():
+            self._refresh()
+            if self._credits.get(key, 0) > 0:
+                return self._append("D", key, -1)
+            return False
+
+    def save(self, credits):
+        """Write a full snapshot and start a fresh log."""
+        with self._file_lock():
+            super().save(credits)
+            try:
+                os.remove(self.log_path)
+            except FileNotFoundError:
+                pass
+            self._log_offset = 0
+            return True
+
+    # -- compaction ----------------------------------------------------------
+
+    def compact(self):
+        """Fold the log into credits.json and truncate it."""
+        with self._file_lock():
+            self._refresh()
+            return self.save(self._credits)
+
+    def _maybe_compact(self):
+        if self._compacting or self._log_offset < self.compact_after * LEDGER_RECORD_SIZE:
+            return
+
+        self._compacting = True
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"Error compacting credit ledger: {e}")
+            finally:
+                self._compacting = False
+
+        threading.Thread(target=run, name="credit-ledger-compaction", daemon=True).start()
+
+
+# ============================================================================
+# SQLITE STORE
+# ============================================================================
+
+class SqliteCreditStore:
+    """
+    Keeps licenses in a SQLite database in WAL mode so app.py, admin.py and
+    any number of threads or processes can share it. A deduction is a single
+    conditional UPDATE, so concurrent sessions can never lose an update or
+    overdraw a key. Each thread gets its own connection.
+
+    License and credit totals are kept in license_totals by triggers, and
+    substring search uses an FTS5 trigram index where SQLite provides one.
+    """
+
+    def __init__(self, path=CREDITS_DB_FILE, migrate_from=CREDITS_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._fts = False
+        self.stats = {}
+
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS licenses (
+                license_key TEXT PRIMARY KEY,
+                credits INTEGER NOT NULL CHECK (credits >= 0)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS reservations (
+                reservation_id TEXT PRIMARY KEY,
+                license_key TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS reservations_expires_at
+            ON reservations (expires_at)
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value TEXT
+            ) WITHOUT ROWID
+        """)
+        self._create_admin_indexes(conn)
+
+        if migrate_from:
+            migrate_json_to_sqlite(migrate_from, store=self)
+
+    def _create_admin_indexes(self, conn):
+        # Insert/delete triggers are skipped while save() rewrites the
+        # table; it rebuilds the totals and the search index once afterwards
+        unless_bulk = "WHEN NOT EXISTS (SELECT 1 FROM meta WHERE name = 'bulk_load')"
+
+        with conn:
+            # Created together with the triggers so no write is missed
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS license_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    licenses INTEGER NOT NULL,
+                    credits INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                INSERT OR IGNORE INTO license_totals (id, licenses, credits)
+                SELECT 0, COUNT(*), COALESCE(SUM(credits), 0) FROM licenses
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS license_totals_insert AFTER INSERT ON licenses
+                {unless_bulk}
+                BEGIN
+                    UPDATE license_totals
+                    SET licenses = licenses + 1, credits = credits + new.credits;
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS license_totals_update AFTER UPDATE OF credits ON licenses
+                BEGIN
+                    UPDATE license_totals SET credits = credits + new.credits - old.credits;
+                END
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS license_totals_delete AFTER DELETE ON licenses
+                {unless_bulk}
+                BEGIN
+                    UPDATE license_totals
+                    SET licenses = licenses - 1, credits = credits - old.credits;
+                END
+            """)
+
+            exists = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'license_search'"
+            ).fetchone()
+            if not exists:
+                try:
+                    conn.execute(
+                        "CREATE VIRTUAL TABLE license_search "
+                        "USING fts5(license_key, tokenize = 'trigram')"
+                    )
+                except sqlite3.OperationalError:
+                    return  # No FTS5 or trigram tokenizer; search scans instead
+                conn.execute("INSERT INTO license_search (license_key) SELECT license_key FROM licenses")
+
+            # Stale rows (e.g. deleted keys under 3 characters, which a
+            # trigram query cannot find) are dropped by the join in search()
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS license_search_insert AFTER INSERT ON licenses
+                {unless_bulk}
+                BEGIN
+                    INSERT INTO license_search (license_key) VALUES (new.license_key);
+                END
+            """)
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS license_search_delete AFTER DELETE ON licenses
+                {unless_bulk}
+                BEGIN
+                    DELETE FROM license_search
+                    WHERE license_search MATCH '"' || replace(old.license_key, '"', '""') || '"'
+                    AND license_key = old.license_key;
+                END
+            """)
+            self._fts = True
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def load(self):
+        """Return a {license_key: credits} dict."""
+        rows = self._connect().execute("SELECT license_key, credits FROM licenses")
+        return dict(rows)
+
+    def save(self, credits):
+        """Replace the stored credits with the given dict."""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("INSERT INTO meta (name, value) VALUES ('bulk_load', '1')")
+            conn.execute("DELETE FROM licenses")
+            conn.executemany(
+                "INSERT INTO licenses (license_key, credits) VALUES (?, ?)",
+                [(key, int(value)) for key, value in credits.items()]
+            )
+            conn.execute("DELETE FROM meta WHERE name = 'bulk_load'")
+
+            conn.execute(
+                "UPDATE license_totals SET (licenses, credits) = "
+                "(SELECT COUNT(*), COALESCE(SUM(credits), 0) FROM licenses)"
+            )
+            if self._fts:
+                conn.execute("DELETE FROM license_search")
+                conn.execute("INSERT INTO license_search (license_key) SELECT license_key FROM licenses")
+        return True
+
+    def get(self, key):
+        """Return the credits for key, or None if the key is unknown."""
+        row = self._connect().execute(
+            "SELECT credits FROM licenses WHERE license_key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, credits):
+        self._connect().execute(
+            "INSERT INTO licenses (license_key, credits) VALUES (?, ?) "
+            "ON CONFLICT (license_key) DO UPDATE SET credits = excluded.credits",
+            (key, int(credits))
+        )
+        return True
+
+    def add(self, key, amount):
+        self._connect().execute(
+            "INSERT INTO licenses (license_key, credits) VALUES (?, ?) "
+            "ON CONFLICT (license_key) DO UPDATE SET credits = credits + excluded.credits",
+            (key, int(amount))
+        )
+        return True
+
+    def delete(self, key):
+        cursor = self._connect().execute(
+            "DELETE FROM licenses WHERE license_key = ?", (key,)
+        )
+        return cursor.rowcount == 1
+
+    def deduct(self, key):
+        """Take one credit from key if it has any left."""
+        cursor = self._connect().execute(
+            "UPDATE licenses SET credits = credits - 1 "
+            "WHERE license_key = ? AND credits > 0",
+            (key,)
+        )
+        return cursor.rowcount == 1
+
+    # -- admin queries -------------------------------------------------------
+
+    def search(self, query="", offset=0, limit=50, contains=False):
+        """
+        Page of (license_key, credits) starting with or containing query.
+        Prefix matches come from the primary key in key order; substring
+        matches from the trigram index in insertion order.
+        """
+        conn = self._connect()
+        if contains and query:
+            if self._fts and len(query) >= 3 and not any(c in query for c in "%_"):
+                return conn.execute(
+                    "SELECT l.license_key, l.credits FROM license_search s "
+                    "JOIN licenses l ON l.license_key = s.license_key "
+                    "WHERE s.license_key LIKE ? LIMIT ? OFFSET ?",
+                    (f"%{query}%", limit, offset)
+                ).fetchall()
+            return conn.execute(
+                "SELECT license_key, credits FROM licenses WHERE instr(license_key, ?) > 0 "
+                "ORDER BY license_key LIMIT ? OFFSET ?",
+                (query, limit, offset)
+            ).fetchall()
+
+        if query:
+            # Every key with the prefix sorts in [query, query with its last character bumped)
+            upper = query[:-1] + chr(ord(query[-1]) + 1)
+            return conn.execute(
+                "SELECT license_key, credits FROM licenses "
+                "WHERE license_key >= ? AND license_key < ? "
+                "ORDER BY license_key LIMIT ? OFFSET ?",
+                (query, upper, limit, offset)
+            ).fetchall()
+
+        return conn.execute(
+            "SELECT license_key, credits FROM licenses ORDER BY license_key LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+
+    def totals(self):
+        """(number of licenses, total credits), maintained by triggers."""
+        return self._connect().execute(
+            "SELECT licenses, credits FROM license_totals WHERE id = 0"
+        ).fetchone()
+
+    # -- reservations --------------------------------------------------------
+    # Held credits are recorded in the reservations table, so holds survive
+    # restarts and any process can expire them.
+
+    def reserve(self, key, ttl=RESERVATION_TTL):
+        """Hold one credit for key. Returns a reservation id or None."""
+        self.expire_reservations()
+        reservation_id = uuid.uuid4().hex
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            cursor = conn.execute(
+                "UPDATE licenses SET credits = credits - 1 "
+                "WHERE license_key = ? AND credits > 0",
+                (key,)
+            )
+            if cursor.rowcount != 1:
+                return None
+            conn.execute(
+                "INSERT INTO reservations (reservation_id, license_key, expires_at) "
+                "VALUES (?, ?, ?)",
+                (reservation_id, key, time.time() + ttl)
+            )
+        return reservation_id
+
+    def commit(self, reservation_id):
+        """Keep a held credit. False if the reservation already expired."""
+        cursor = self._connect().execute(
+            "DELETE FROM reservations WHERE reservation_id = ?", (reservation_id,)
+        )
+        return cursor.rowcount == 1
+
+    def release(self, reservation_id):
+        """Give a held credit back to its key."""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return self._refund(conn, [reservation_id]) == 1
+
+    def expire_reservations(self, now=None):
+        """Release every reservation past its deadline."""
+        conn = self._connect()
+        now = now or time.time()
+        if not conn.execute(
+            "SELECT 1 FROM reservations WHERE expires_at < ? LIMIT 1", (now,)
+        ).fetchone():
+            return 0
+
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = [row[0] for row in conn.execute(
+                "SELECT reservation_id FROM reservations WHERE expires_at < ?", (now,)
+            )]
+            return self._refund(conn, expired)
+
+    def _refund(self, conn, reservation_ids):
+        refunded = 0
+        for reservation_id in reservation_ids:
+            row = conn.execute(
+                "SELECT license_key FROM reservations WHERE reservation_id = ?",
+                (reservation_id,)
+            ).fetchone()
+            if row is None:
+                continue
+            conn.execute("DELETE FROM reservations WHERE reservation_id = ?", (reservation_id,))
+            conn.execute(
+                "UPDATE licenses SET credits = credits + 1 WHERE license_key = ?", row
+            )
+            refunded += 1
+        return refunded
+
+
+def migrate_json_to_sqlite(json_path=CREDITS_FILE, log_path=CREDITS_LOG_FILE, store=None):
+    """
+    Import credits.json (plus any pending credits.log records) into the
+    SQLite store, or the demo keys if there is no credits.json. Runs only
+    once per database; returns the number of licenses imported.
+    """
+    store = store or SqliteCreditStore(migrate_from=None)
+    conn = store._connect()
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT 1 FROM meta WHERE name = 'migrated_from'").fetchone():
+            return 0
+
+        if os.path.exists(json_path):
+            credits = LedgerCreditStore(json_path, log_path).load()
+        else:
+            credits = dict(DEFAULT_CREDITS)
+
+        conn.executemany(
+            "INSERT OR IGNORE INTO licenses (license_key, credits) VALUES (?, ?)",
+            [(key, max(int(value), 0)) for key, value in credits.items()]
+        )
+        conn.execute(
+            "INSERT INTO meta (name, value) VALUES ('migrated_from', ?)",
+            (os.path.abspath(json_path),)
+        )
+
+    return len(credits)
+
+
+# ============================================================================
+# MODULE-LEVEL API
+# ============================================================================
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide credit store for the configured backend."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if CREDITS_BACKEND == "json":
+                    _store = JsonCreditStore()
+                elif CREDITS_BACKEND == "ledger":
+                    _store = LedgerCreditStore()
+                else:
+                    _store = SqliteCreditStore()
+    return _store
+
+
+_NOT_LOADED = object()
+_secret_credits_cache = _NOT_LOADED
+
+
+def _secret_credits():
+    """
+    Credits from Streamlit secrets (cloud deployments), or None.
+    Secrets are read once per process rather than on every rerun.
+    """
+    global _secret_credits_cache
+    if _secret_credits_cache is _NOT_LOADED:
+        secret_credits = None
+        try:
+            import streamlit as st
+            if "credits" in st.secrets:
+                secret_credits = dict(st.secrets["credits"])
+        except Exception:
+            pass
+        _secret_credits_cache = secret_credits
+    return _secret_credits_cache
+
+
+def search_licenses(query="", offset=0, limit=50, contains=False):
+    """Page of (license_key, credits) whose key starts with (or contains) query."""
+    secret_credits = _secret_credits()
+    if secret_credits is not None:
+        keys = _match_keys(sorted(secret_credits), query, offset, limit, contains)
+        return [(key, secret_credits[key]) for key in keys]
+
+    try:
+        return get_store().search(query, offset, limit, contains)
+    except Exception as e:
+        print(f"Error searching licenses: {e}")
+        return []
+
+
+def license_totals():
+    """(number of licenses, total credits) without loading every license."""
+    secret_credits = _secret_credits()
+    if secret_credits is not None:
+        return len(secret_credits), sum(secret_credits.values())
+
+    try:
+        return tuple(get_store().totals())
+    except Exception as e:
+        print(f"Error loading license totals: {e}")
+        return 0, 0
+
+
+def cache_stats():
+    """Hit/miss counters of the shared credit index."""
+    return dict(get_store().stats)
+
+
+def load_credits():
+    """Load credits from Streamlit secrets (cloud) or the local store."""
+    secret_credits = _secret_credits()
+    if secret_credits is not None:
+        return secret_credits
+
+    try:
+        return get_store().load()
+    except Exception as e:
+        print(f"Error loading credits: {e}")
+        return {}
+
+
+def save_credits(credits_data):
+    """Replace all credits. Fails silently on cloud (uses secrets instead)."""
+    try:
+        return get_store().save(credits_data)
+    except Exception:
+        # On cloud, file system is read-only for app directory
+        return False
+
+
+def get_credits(key):
+    """Return the credits for a license key, or None if it does not exist."""
+    secret_credits = _secret_credits()
+    if secret_credits is not None:
+        return secret_credits.get(key)
+
+    try:
+        with metrics.timer("credit_lookup"):
+            return get_store().get(key)
+    except Exception as e:
+        print(f"Error loading credits: {e}")
+        return None
+
+
+def set_credits(key, credits):
+    """Create or overwrite a license key with the given credits."""
+    try:
+        return get_store().set(key, credits)
+    except Exception:
+        return False
+
+
+def add_credits(key, amount):
+    """Add credits to a license key, creating it if needed."""
+    try:
+        return get_store().add(key, amount)
+    except Exception:
+        return False
+
+
+def delete_license(key):
+    """Remove a license key."""
+    try:
+        return get_store().delete(key)
+    except Exception:
+        return False
+
+
+def validate_license_key(key):
+    """Check if license key is valid and has credits."""
+    credits = get_credits(key)
+    if credits is not None and credits > 0:
+        return True, credits
+    return False, 0
+
+
+def deduct_credit(key):
+    """Deduct one credit from the license key."""
+    secret_credits = _secret_credits()
+    if secret_credits is not None:
+        # Secrets are read-only; usage is not persisted on cloud
+        return secret_credits.get(key, 0) > 0
+
+    try:
+        with metrics.timer("credit_deduct"):
+            return get_store().deduct(key)
+    except Exception:
+        return False
+
+
+def reserve_credit(key):
+    """
+    Hold one credit before starting an analysis.
+    Returns a reservation id, or None if the key has no credits left.
+    """
+    secret_credits = _secret_credits()
+    if secret_credits is not None:
+        return uuid.uuid4().hex if secret_credits.get(key, 0) > 0 else None
+
+    try:
+        with metrics.timer("credit_reserve"):
+            return get_store().reserve(key)
+    except Exception as e:
+        print(f"Error reserving credit: {e}")
+        return None
+
+
+def commit_reservation(reservation_id):
+    """Charge a reserved credit once the analysis succeeded."""
+    if _secret_credits() is not None:
+        return True
+
+    try:
+        with metrics.timer("credit_commit"):
+            return get_store().commit(reservation_id)
+    except Exception:
+        return False
+
+
+def release_reservation(reservation_id):
+    """Return a reserved credit after a failed or abandoned analysis."""
+    if _secret_credits() is not None:
+        return True
+
+    try:
+        with metrics.timer("credit_release"):
+            return get_store().release(reservation_id)
+    except Exception as e:
+        print(f"Error releasing credit: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["migrate"]:
+        count = migrate_json_to_sqlite()
+        print(f"Imported {count} licenses from {CREDITS_FILE} into {CREDITS_DB_FILE}")
+    else:
+        print("Usage: python credit_store.py migrate")
@@ -0,0 +1,118 @@
+"""
+ValueAI - Image Preprocessing
+Orients, shrinks and re-encodes photos before they are sent to Gemini
+"""
+
+import io
+import time
+
+import metrics
+from settings import get_setting
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Longest edge in pixels after downscaling (0 keeps the original size)
+PREPROCESS_MAX_EDGE = get_setting("PREPROCESS_MAX_EDGE", 1536)
+
+# "JPEG" or "WEBP"
+PREPROCESS_FORMAT = get_setting("PREPROCESS_FORMAT", "JPEG")
+
+# Encoder quality, 1-100
+PREPROCESS_QUALITY = get_setting("PREPROCESS_QUALITY", 85)
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp"
+}
+
+# ============================================================================
+# PIPELINE
+# ============================================================================
+
+def _to_rgb(image):
+    """Convert to RGB, flattening any transparency onto white."""
+    from PIL import Image
+
+    if image.mode == "RGB":
+        return image
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+
+    return image.convert("RGB")
+
+
+def preprocess_image(image, max_edge=None, image_format=None, quality=None, original_bytes=None):
+    """
+    Prepare a PIL image for the Gemini API.
+
+    Stages: decode (with JPEG draft mode when shrinking), EXIF orientation,
+    RGB conversion, downscale to max_edge and re-encode as JPEG/WebP.
+
+    Returns a dict with:
+        "blob":  {"mime_type": ..., "data": bytes} ready for generate_content
+        "image": the processed PIL image
+        "stats": sizes, bytes saved and milliseconds spent per stage
+    """
+    from PIL import Image, ImageOps
+
+    max_edge = PREPROCESS_MAX_EDGE if max_edge is None else max_edge
+    image_format = (image_format or PREPROCESS_FORMAT).upper()
+    quality = quality or PREPROCESS_QUALITY
+
+    if image_format not in MIME_TYPES:
+        raise ValueError(f"Unsupported preprocessing format: {image_format}")
+
+    timings = {}
+    original_size = image.size
+
+    # Decode - let libjpeg scale down by 1/2, 1/4 or 1/8 while decoding
+    start = time.perf_counter()
+    if max_edge and image.format in ("JPEG", "MPO"):
+        image.draft("RGB", (max_edge, max_edge))
+    image.load()
+    timings["decode"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image = ImageOps.exif_transpose(image)
+    timings["orient"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    image = _to_rgb(image)
+    timings["rgb"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    if max_edge and max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    timings["resize"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    if image_format == "JPEG":
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    else:
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    data = buffer.getvalue()
+    timings["encode"] = time.perf_counter() - start
+
+    metrics.observe("image_decode_seconds", timings["decode"])
+    metrics.observe("image_preprocess_seconds", sum(timings.values()))
+
+    return {
+        "blob": {"mime_type": MIME_TYPES[image_format], "data": data},
+        "image": image,
+        "stats": {
+            "original_size": original_size,
+            "output_size": image.size,
+            "original_bytes": original_bytes,
+            "output_bytes": len(data),
+            "bytes_saved": original_bytes - len(data) if original_bytes else None,
+            "timings_ms": {stage: seconds * 1000 for stage, seconds in timings.items()},
+            "total_ms": sum(timings.values()) * 1000
+        }
+    }
@@ -0,0 +1,99 @@
+"""
+ValueAI - Incremental JSON Parser
+Surfaces the top-level fields of a streamed JSON object as they complete
+"""
+
+import json
+
+
+class IncrementalJSONObject:
+    """
+    Feed text chunks of a JSON object; feed() returns the (key, value)
+    pairs of every top-level member completed by that chunk.
+
+    String, object and array values are reported as soon as their closing
+    character arrives; numbers, booleans and null once the following comma
+    or closing brace arrives. Anything before the opening brace (such as a
+    ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.done = False
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._in_value = False
+        self._member_start = None
+        self._member_emitted = False
+
+    def _emit(self, end, completed):
+        if self._member_emitted or self._member_start is None:
+            return
+        text = self._buffer[self._member_start:end].strip()
+        if not text:
+            return
+        try:
+            member = json.loads("{" + text + "}")
+        except json.JSONDecodeError:
+            return
+        self._member_emitted = True
+        for key, value in member.items():
+            self.fields[key] = value
+            completed.append((key, value))
+
+    def feed(self, chunk):
+        """Add text; return the list of (key, value) pairs it completed."""
+        completed = []
+        if self.done:
+            return completed
+
+        self._buffer += chunk
+        buffer = self._buffer
+
+        for i in range(self._pos, len(buffer)):
+            c = buffer[i]
+
+            if self._depth == 0:
+                if c == "{":
+                    self._depth = 1
+                    self._member_start = i + 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._in_value:
+                        self._emit(i + 1, completed)
+                continue
+
+            if c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._depth += 1
+            elif c in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._in_value:
+                    self._emit(i + 1, completed)
+                elif self._depth == 0:
+                    self._emit(i, completed)
+                    self.done = True
+                    self._pos = i + 1
+                    return completed
+            elif self._depth == 1:
+                if c == ":":
+                    self._in_value = True
+                elif c == ",":
+                    self._emit(i, completed)
+                    self._member_start = i + 1
+                    self._member_emitted = False
+                    self._in_value = False
+
+        self._pos = len(buffer)
+        return completed
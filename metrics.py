@@ -0,0 +1,281 @@
+"""
+ValueAI - Metrics
+Process-wide counters, gauges and latency histograms shared by every session
+
+Exported as Prometheus text on METRICS_PORT (/metrics, plus /metrics.json
+for the admin panel) and/or appended as JSONL snapshots to
+METRICS_FLUSH_FILE. With METRICS_ENABLED off every call is a no-op.
+"""
+
+import bisect
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from settings import get_setting
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+METRICS_ENABLED = get_setting("METRICS_ENABLED", True)
+
+# Serve /metrics (Prometheus text) and /metrics.json on this port (0 = off)
+METRICS_PORT = get_setting("METRICS_PORT", 0)
+
+# Append a JSON snapshot to this file every METRICS_FLUSH_INTERVAL seconds
+METRICS_FLUSH_FILE = get_setting("METRICS_FLUSH_FILE", "")
+METRICS_FLUSH_INTERVAL = get_setting("METRICS_FLUSH_INTERVAL", 60.0)
+
+METRICS_PREFIX = "valueai_"
+
+# Recent observations kept per series for percentiles
+SAMPLE_WINDOW = 2048
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+_counters = {}
+_samples = {}
+_histograms = {}
+
+
+# ============================================================================
+# RECORDING
+# ============================================================================
+
+def inc(name, amount=1):
+    """Add amount to a counter."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def gauge(name, value):
+    """Set a counter to an absolute value (e.g. a current queue depth)."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        _counters[name] = value
+
+
+def get(name):
+    """Current value of a counter (0 if never incremented)."""
+    return _counters.get(name, 0)
+
+
+def observe(name, value):
+    """Record one observation in seconds (histogram + recent samples)."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        samples = _samples.get(name)
+        if samples is None:
+            samples = _samples[name] = collections.deque(maxlen=SAMPLE_WINDOW)
+            _histograms[name] = [[0] * (len(BUCKETS) + 1), 0.0]
+        samples.append(value)
+        histogram = _histograms[name]
+        histogram[0][bisect.bisect_left(BUCKETS, value)] += 1
+        histogram[1] += value
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(stage):
+    """Context manager recording the block's duration as <stage>_seconds."""
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Timer(f"{stage}_seconds")
+
+
+# ============================================================================
+# READING
+# ============================================================================
+
+def count(name):
+    """Number of recent observations for a series."""
+    return len(_samples.get(name, ()))
+
+
+def percentile(name, q):
+    """q-th percentile (0-100) of the recent observations, or None."""
+    with _lock:
+        values = sorted(_samples.get(name, ()))
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * q / 100))]
+
+
+def snapshot():
+    """Copy of all counters, plus p50/p95/p99 of each observed series."""
+    with _lock:
+        result = dict(_counters)
+        names = list(_samples)
+    for name in names:
+        for q in (50, 95, 99):
+            result[f"{name}_p{q}"] = percentile(name, q)
+    return result
+
+
+def summary():
+    """Counters and per-series {count, sum, p50, p95, p99}, as JSON-ready dicts."""
+    with _lock:
+        counters = dict(_counters)
+        totals = {name: (sum(h[0]), h[1]) for name, h in _histograms.items()}
+    series = {
+        name: {
+            "count": total,
+            "sum": seconds,
+            "p50": percentile(name, 50),
+            "p95": percentile(name, 95),
+            "p99": percentile(name, 99)
+        }
+        for name, (total, seconds) in totals.items()
+    }
+    return {"timestamp": time.time(), "counters": counters, "series": series}
+
+
+def prometheus_text():
+    """All metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        histograms = {name: (list(h[0]), h[1]) for name, h in _histograms.items()}
+
+    for name, value in sorted(counters.items()):
+        kind = "counter" if name.endswith("_total") else "gauge"
+        lines.append(f"# TYPE {METRICS_PREFIX}{name} {kind}")
+        lines.append(f"{METRICS_PREFIX}{name} {value}")
+
+    for name, (buckets, seconds) in sorted(histograms.items()):
+        metric = METRICS_PREFIX + name
+        lines.append(f"# TYPE {metric} histogram")
+        cumulative = 0
+        for bound, hits in zip(BUCKETS + ("+Inf",), buckets):
+            cumulative += hits
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{metric}_sum {seconds}")
+        lines.append(f"{metric}_count {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheus_text(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(summary()), "application/json"
+        else:
+            self.send_error(404)
+            return
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_exporting = False
+
+
+def start_exporters(port=None, flush_file=None, interval=None):
+    """
+    Start the HTTP endpoint and/or the JSONL flusher in daemon threads.
+    Only the first call per process does anything, so this is safe to
+    run on every Streamlit rerun.
+    """
+    global _exporting
+    port = METRICS_PORT if port is None else port
+    flush_file = METRICS_FLUSH_FILE if flush_file is None else flush_file
+    interval = METRICS_FLUSH_INTERVAL if interval is None else interval
+
+    with _lock:
+        if _exporting or not METRICS_ENABLED:
+            return
+        _exporting = True
+
+    if port:
+        try:
+            server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        except OSError as e:
+            # Another process (e.g. a second app instance) owns the port
+            print(f"Metrics endpoint unavailable on port {port}: {e}")
+
+    if flush_file:
+        def flush():
+            while True:
+                time.sleep(interval)
+                try:
+                    with open(flush_file, "a") as f:
+                        f.write(json.dumps(summary()) + "\n")
+                except OSError as e:
+                    print(f"Error flushing metrics: {e}")
+
+        threading.Thread(target=flush, name="metrics-flush", daemon=True).start()
+
+
+def load_summary():
+    """
+    Metrics of the app process for the admin panel: from the HTTP endpoint,
+    else the last flushed JSONL snapshot, else this process's own metrics.
+    """
+    if METRICS_PORT:
+        try:
+            from urllib.request import urlopen
+            with urlopen(f"http://127.0.0.1:{METRICS_PORT}/metrics.json", timeout=2) as response:
+                return json.load(response)
+        except Exception:
+            pass
+
+    if METRICS_FLUSH_FILE:
+        try:
+            with open(METRICS_FLUSH_FILE, "rb") as f:
+                f.seek(0, 2)
+                f.seek(max(0, f.tell() - 65536))
+                lines = f.read().splitlines()
+            if lines:
+                return json.loads(lines[-1])
+        except (OSError, ValueError):
+            pass
+
+    return summary()
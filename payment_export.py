@@ -0,0 +1,140 @@
+"""
+ValueAI - Payment Export
+CSV and Parquet exports of the payment log, streamed in bounded memory
+
+Entries are read from the log one chunk at a time and written straight
+to the output file, so memory stays flat however long the log is.
+Parquet needs pyarrow; each chunk becomes one row group.
+"""
+
+import csv
+import importlib.util
+import io
+from datetime import datetime
+
+from payment_log import iter_payment_chunks
+from settings import get_setting
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Log entries held in memory at a time (one Parquet row group each)
+EXPORT_CHUNK_ROWS = get_setting("EXPORT_CHUNK_ROWS", 10000)
+
+EXPORT_COLUMNS = ["timestamp", "license_key", "email", "amount_eur", "credits", "plan_id", "session_id"]
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+
+# ============================================================================
+# FILTERS
+# ============================================================================
+
+def iter_export_chunks(start=None, end=None, plans=None, chunk_size=None):
+    """
+    Yield lists of log entries, filtered by day (start/end are inclusive
+    dates) and plan_id. Chunks may be smaller than chunk_size after filtering.
+    """
+    first_day = start.isoformat() if start else None
+    last_day = end.isoformat() if end else None
+    plans = set(plans) if plans else None
+
+    for chunk in iter_payment_chunks(chunk_size or EXPORT_CHUNK_ROWS):
+        if first_day or last_day or plans:
+            chunk = [
+                entry for entry in chunk
+                if (not first_day or (entry.get("timestamp") or "")[:10] >= first_day)
+                and (not last_day or (entry.get("timestamp") or "")[:10] <= last_day)
+                and (not plans or entry.get("plan_id") in plans)
+            ]
+        if chunk:
+            yield chunk
+
+
+# ============================================================================
+# WRITERS
+# ============================================================================
+
+def write_csv(out, **filters):
+    """Write matching entries as CSV to a binary file; returns the row count."""
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=True)
+    try:
+        writer = csv.DictWriter(text, fieldnames=EXPORT_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        rows = 0
+        for chunk in iter_export_chunks(**filters):
+            writer.writerows(chunk)
+            rows += len(chunk)
+        return rows
+    finally:
+        text.detach()  # Leave out open for the caller
+
+
+def _parquet_schema(pa):
+    return pa.schema([
+        ("timestamp", pa.timestamp("us")),
+        ("license_key", pa.string()),
+        ("email", pa.string()),
+        ("amount_eur", pa.float64()),
+        ("credits", pa.int64()),
+        ("plan_id", pa.string()),
+        ("session_id", pa.string())
+    ])
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def write_parquet(out, **filters):
+    """Write matching entries as Parquet (one row group per chunk); returns the row count."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema(pa)
+    rows = 0
+    with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+        for chunk in iter_export_chunks(**filters):
+            columns = {name: [entry.get(name) for entry in chunk] for name in EXPORT_COLUMNS}
+            columns["timestamp"] = [_parse_timestamp(value) for value in columns["timestamp"]]
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+def parquet_available():
+    """True if pyarrow is installed (checked without importing it)."""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def export_payments(out, export_format="csv", **filters):
+    """Write the export in the given format ("csv" or "parquet") to a binary file."""
+    if export_format == "csv":
+        return write_csv(out, **filters)
+    if export_format == "parquet":
+        return write_parquet(out, **filters)
+    raise ValueError(f"Unsupported export format: {export_format}")
+
+
+if __name__ == "__main__":
+    import argparse
+    from datetime import date
+
+    parser = argparse.ArgumentParser(description="Export the payment log")
+    parser.add_argument("format", choices=sorted(EXPORT_FORMATS))
+    parser.add_argument("output")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, help="last day (YYYY-MM-DD)")
+    parser.add_argument("--plan", action="append", dest="plans", help="plan_id (repeatable)")
+    args = parser.parse_args()
+
+    with open(args.output, "wb") as f:
+        count = export_payments(f, args.format, start=args.start, end=args.end, plans=args.plans)
+    print(f"Exported {count} payments to {args.output}")
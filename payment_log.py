@@ -0,0 +1,453 @@
+"""
+ValueAI - Payment Log
+Append-only JSONL record of every sale, shared by payments.py and admin.py
+
+One JSON object per line, written with a single fsync'd append. When the
+file passes PAYMENT_LOG_MAX_BYTES it is renamed to payment_log.jsonl.<n>
+(1 = oldest) and a new file is started. Readers stream all segments in
+order and skip a torn last line left by a crash.
+
+Totals by day, plan and email domain are kept in payment_rollups.json,
+updated on every append and caught up from the log when they lag.
+"""
+
+import contextlib
+import glob
+import json
+import os
+import threading
+
+from settings import get_setting
+
+try:
+    import fcntl
+except ImportError:  # Windows: rotation is only guarded within the process
+    fcntl = None
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+PAYMENT_LOG_FILE = "payment_log.jsonl"
+
+# Format used before the JSONL log; converted once, then renamed
+LEGACY_PAYMENT_LOG_FILE = "payment_log.json"
+
+# Start a new segment once the current one is this large
+PAYMENT_LOG_MAX_BYTES = get_setting("PAYMENT_LOG_MAX_BYTES", 64 * 1024 * 1024)
+
+# Revenue, credits and transaction counts by day, plan_id and email domain
+PAYMENT_ROLLUPS_FILE = "payment_rollups.json"
+
+_lock = threading.Lock()
+_converted = False
+
+
+# ============================================================================
+# SEGMENTS
+# ============================================================================
+
+def _segment_number(path, base):
+    suffix = path[len(base) + 1:]
+    return int(suffix) if suffix.isdigit() else None
+
+
+def segments(path=PAYMENT_LOG_FILE):
+    """All files of the log, oldest first (rotated segments, then current)."""
+    numbered = []
+    for candidate in glob.glob(glob.escape(path) + ".*"):
+        number = _segment_number(candidate, path)
+        if number is not None:
+            numbered.append((number, candidate))
+    files = [candidate for _, candidate in sorted(numbered)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def _rotate(path):
+    numbers = [_segment_number(p, path) for p in segments(path)[:-1]]
+    next_number = max((n for n in numbers if n is not None), default=0) + 1
+    os.rename(path, f"{path}.{next_number}")
+
+
+# ============================================================================
+# WRITING
+# ============================================================================
+
+def _open_locked(path):
+    """Open path for appending, holding an exclusive lock where supported."""
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        if fcntl is None:
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        # Another process may have rotated the file while we waited
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def append_payment(entry, path=PAYMENT_LOG_FILE):
+    """Append one entry as a single fsync'd line, rotating large files first."""
+    if path == PAYMENT_LOG_FILE:
+        convert_legacy_log()
+    line = (json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8")
+
+    with _lock:
+        fd = _open_locked(path)
+        try:
+            size = os.fstat(fd).st_size
+            if size and size + len(line) > PAYMENT_LOG_MAX_BYTES:
+                _rotate(path)
+                os.close(fd)
+                fd = _open_locked(path)
+                size = 0
+
+            # Keep a line torn by an earlier crash from swallowing this one
+            if size and hasattr(os, "pread") and os.pread(fd, 1, size - 1) != b"\n":
+                line = b"\n" + line
+
+            os.write(fd, line)
+            os.fsync(fd)
+
+            # Still under the log's lock, so rollup writers never interleave
+            if path == PAYMENT_LOG_FILE:
+                try:
+                    save_rollups(_read_rollups(path, PAYMENT_ROLLUPS_FILE))
+                except (OSError, ValueError) as e:
+                    # The entry is safe in the log; the next update catches up
+                    print(f"Error updating payment rollups: {e}")
+        finally:
+            os.close(fd)
+
+
+# ============================================================================
+# READING
+# ============================================================================
+
+def _parse_lines(f):
+    for line in f:
+        if not line.endswith(b"\n"):
+            break  # Torn write from a crash; never acknowledged
+        try:
+            yield json.loads(line)
+        except ValueError:
+            continue
+
+
+def iter_payments(path=PAYMENT_LOG_FILE):
+    """Yield every payment entry, oldest first, without loading the whole log."""
+    if path == PAYMENT_LOG_FILE:
+        convert_legacy_log()
+    for segment in segments(path):
+        try:
+            with open(segment, "rb") as f:
+                yield from _parse_lines(f)
+        except FileNotFoundError:
+            continue  # Rotated away while we were listing
+
+
+def recent_payments(limit, path=PAYMENT_LOG_FILE):
+    """The last limit entries, oldest first, reading only the end of the log."""
+    if path == PAYMENT_LOG_FILE:
+        convert_legacy_log()
+    entries = []
+    for segment in reversed(segments(path)):
+        if len(entries) >= limit:
+            break
+        try:
+            with open(segment, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                position = f.tell()
+                data = b""
+                while position and data.count(b"\n") <= limit - len(entries):
+                    step = min(65536, position)
+                    position -= step
+                    f.seek(position)
+                    data = f.read(step) + data
+        except FileNotFoundError:
+            continue
+
+        lines = data.splitlines(keepends=True)
+        if position:
+            lines = lines[1:]  # Starts mid-line
+        entries[:0] = list(_parse_lines(lines))[-(limit - len(entries)):]
+    return entries
+
+
+def iter_payment_chunks(chunk_size=10000, path=PAYMENT_LOG_FILE):
+    """Yield lists of up to chunk_size entries (e.g. one DataFrame each)."""
+    chunk = []
+    for entry in iter_payments(path):
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class PaymentLogFollower:
+    """
+    Incremental reader for indexes derived from the log.
+    read() returns (reset, entries): on the first call, or after a
+    rotation, reset is True and entries is the whole log; otherwise
+    entries holds only the lines appended since the previous call.
+    """
+
+    def __init__(self, path=PAYMENT_LOG_FILE):
+        self.path = path
+        self._inode = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def read(self):
+        if self.path == PAYMENT_LOG_FILE:
+            convert_legacy_log()
+        with self._lock:
+            try:
+                f = open(self.path, "rb")
+            except FileNotFoundError:
+                reset = self._inode is not None
+                self._inode, self._offset = None, 0
+                return reset, list(iter_payments(self.path)) if reset else []
+
+            with f:
+                inode = os.fstat(f.fileno()).st_ino
+                entries = []
+                reset = inode != self._inode
+                if reset:
+                    # Earlier segments first, then this file from the start
+                    for segment in segments(self.path)[:-1]:
+                        with open(segment, "rb") as old:
+                            entries.extend(_parse_lines(old))
+                    self._inode, self._offset = inode, 0
+
+                f.seek(self._offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    self._offset += len(line)
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        continue
+                return reset, entries
+
+
+# ============================================================================
+# PROCESSED SESSIONS
+# ============================================================================
+
+_sessions = {}
+_sessions_follower = PaymentLogFollower()
+_sessions_lock = threading.Lock()
+_issue_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def session_issue_lock(path=PAYMENT_LOG_FILE):
+    """
+    Exclusive lock across threads and processes (app, webhook worker) for
+    checking find_session() and appending the session's entry as one step.
+    """
+    with _issue_lock:
+        fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+
+def find_session(session_id):
+    """
+    Payment log entry recorded for a Stripe checkout session, or None.
+    Backed by an in-memory index that only reads newly appended lines.
+    """
+    with _sessions_lock:
+        reset, entries = _sessions_follower.read()
+        if reset:
+            _sessions.clear()
+        for entry in entries:
+            if entry.get("session_id"):
+                _sessions[entry["session_id"]] = entry
+        return _sessions.get(session_id)
+
+
+# ============================================================================
+# ROLLUPS
+# ============================================================================
+
+def _empty_rollups():
+    # log_bytes: how much of the log (all segments, oldest first) is counted
+    return {"log_bytes": 0, "totals": {}, "by_day": {}, "by_plan": {}, "by_domain": {}}
+
+
+def _add_to_rollups(rollups, entry):
+    email = entry.get("email") or ""
+    groups = (
+        ("totals", None),
+        ("by_day", (entry.get("timestamp") or "")[:10] or "unknown"),
+        ("by_plan", entry.get("plan_id") or "unknown"),
+        ("by_domain", email.rpartition("@")[2].lower() if "@" in email else "unknown")
+    )
+    for table, key in groups:
+        bucket = rollups[table] if key is None else rollups[table].setdefault(key, {})
+        bucket["transactions"] = bucket.get("transactions", 0) + 1
+        # Whole cents, so rebuilt rollups compare exactly
+        bucket["revenue_cents"] = bucket.get("revenue_cents", 0) + round((entry.get("amount_eur") or 0) * 100)
+        bucket["credits"] = bucket.get("credits", 0) + int(entry.get("credits") or 0)
+
+
+def _catch_up(rollups, path):
+    """Add the entries written after rollups["log_bytes"]."""
+    skip = rollups["log_bytes"]
+    files = segments(path)
+    for index, segment in enumerate(files):
+        try:
+            f = open(segment, "rb")
+        except FileNotFoundError:
+            continue
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if skip >= size:
+                skip -= size
+                continue
+            f.seek(skip)
+            skip = 0
+            for line in f:
+                if not line.endswith(b"\n") and index == len(files) - 1:
+                    break  # Torn write still at the end of the log
+                rollups["log_bytes"] += len(line)
+                try:
+                    _add_to_rollups(rollups, json.loads(line))
+                except ValueError:
+                    continue
+
+    if skip:
+        # The log is shorter than what was counted (replaced or reset)
+        return _catch_up(_empty_rollups(), path)
+    return rollups
+
+
+def load_rollups(path=PAYMENT_LOG_FILE, rollups_path=PAYMENT_ROLLUPS_FILE):
+    """
+    Rollups covering the whole log: the saved ones plus any entries
+    appended since (e.g. after a crash between the append and the save).
+    """
+    if path == PAYMENT_LOG_FILE:
+        convert_legacy_log()
+    return _read_rollups(path, rollups_path)
+
+
+def _read_rollups(path, rollups_path):
+    """load_rollups() without the conversion, for callers holding _lock."""
+    try:
+        with open(rollups_path, "r") as f:
+            rollups = json.load(f)
+    except (OSError, ValueError):
+        rollups = _empty_rollups()
+    return _catch_up(rollups, path)
+
+
+def save_rollups(rollups, rollups_path=PAYMENT_ROLLUPS_FILE):
+    tmp_path = f"{rollups_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(rollups, f, separators=(",", ":"))
+    os.replace(tmp_path, rollups_path)
+
+
+def rebuild_rollups(path=PAYMENT_LOG_FILE, rollups_path=PAYMENT_ROLLUPS_FILE):
+    """
+    Recompute the rollups from the raw log and save them.
+    Returns (rebuilt, saved) so callers can check the saved ones matched.
+    """
+    if path == PAYMENT_LOG_FILE:
+        # Takes _lock itself, so it must run before the rebuild does
+        convert_legacy_log()
+
+    with _lock:
+        fd = _open_locked(path) if os.path.exists(path) else None
+        try:
+            saved = _read_rollups(path, rollups_path)
+            rebuilt = _catch_up(_empty_rollups(), path)
+            save_rollups(rebuilt, rollups_path)
+        finally:
+            if fd is not None:
+                os.close(fd)
+    return rebuilt, saved
+
+
+# ============================================================================
+# CONVERSION
+# ============================================================================
+
+def convert_legacy_log(legacy_path=LEGACY_PAYMENT_LOG_FILE, log_path=PAYMENT_LOG_FILE):
+    """
+    One-time import of payment_log.json into the JSONL log. Legacy entries
+    are placed before any already in the JSONL file, then the old file is
+    renamed to payment_log.json.converted. Returns the entries imported.
+    """
+    global _converted
+    if _converted or not os.path.exists(legacy_path):
+        _converted = True
+        return 0
+
+    with _lock:
+        # Holding the log's lock keeps other processes from appending meanwhile
+        fd = _open_locked(log_path)
+        try:
+            if not os.path.exists(legacy_path):
+                _converted = True
+                return 0
+
+            with open(legacy_path, "r") as f:
+                legacy = json.load(f)
+
+            tmp_path = f"{log_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as out:
+                for entry in legacy:
+                    out.write((json.dumps(entry, separators=(",", ":")) + "\n").encode("utf-8"))
+                with open(log_path, "rb") as current:
+                    for line in current:
+                        if line.endswith(b"\n"):
+                            out.write(line)
+                out.flush()
+                os.fsync(out.fileno())
+
+            os.replace(tmp_path, log_path)
+            os.rename(legacy_path, legacy_path + ".converted")
+            _converted = True
+
+            # Legacy entries now come first; count the log from the start
+            if log_path == PAYMENT_LOG_FILE:
+                save_rollups(_catch_up(_empty_rollups(), log_path))
+            return len(legacy)
+        finally:
+            os.close(fd)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] == ["convert"]:
+        count = convert_legacy_log()
+        print(f"Converted {count} entries from {LEGACY_PAYMENT_LOG_FILE} into {PAYMENT_LOG_FILE}")
+    elif sys.argv[1:] == ["rebuild-rollups"]:
+        rebuilt, saved = rebuild_rollups()
+        totals = rebuilt["totals"]
+        print(f"Rebuilt {PAYMENT_ROLLUPS_FILE}: {totals.get('transactions', 0)} transactions, "
+              f"EUR {totals.get('revenue_cents', 0) / 100:.2f}, {totals.get('credits', 0)} credits")
+        if saved == rebuilt:
+            print("The saved rollups matched the log")
+        else:
+            print("The saved rollups did NOT match the log and were replaced")
+            sys.exit(1)
+    else:
+        print("Usage: python payment_log.py convert | rebuild-rollups")
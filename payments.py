@@ -3,21 +3,42 @@ ValueAI - Payment Integration Module
 Handles Stripe payment processing and credit management
 """
 
+import importlib.util
 import streamlit as st
-import stripe
-import json
-import os
+import time
 from datetime import datetime
 
+import metrics
+from credit_store import get_credits, set_credits
+from payment_log import append_payment, find_session, session_issue_lock
+from settings import get_setting
+from stripe_client import get_stripe_client, get_price_id
+from webhook_server import WEBHOOKS_ENABLED, get_webhook_queue
+
+# Payments are disabled when the Stripe library is missing. The library
+# itself is only imported (by stripe_client.py) on the first Stripe call.
+if importlib.util.find_spec("stripe") is None:
+    raise ImportError("No module named 'stripe'")
+
 # ============================================================================
 # STRIPE CONFIGURATION
 # ============================================================================
 
+STRIPE_SUCCESS_URL = get_setting("STRIPE_SUCCESS_URL", "http://localhost:8501?payment=success")
+STRIPE_CANCEL_URL = get_setting("STRIPE_CANCEL_URL", "http://localhost:8501?payment=cancel")
+
+# Reuse an open checkout page unless it expires within this many seconds
+CHECKOUT_REUSE_MARGIN = get_setting("CHECKOUT_REUSE_MARGIN", 300)
+
+# With webhooks, how long the return page polls for the issued license
+# before verifying the session itself
+WEBHOOK_WAIT = get_setting("WEBHOOK_WAIT", 30)
+WEBHOOK_POLL_INTERVAL = get_setting("WEBHOOK_POLL_INTERVAL", 1.5)
+
 def init_stripe():
-    """Initialize Stripe with API keys from secrets."""
+    """Check that the shared Stripe client is configured (secrets are read once)."""
     try:
-        if "STRIPE_SECRET_KEY" in st.secrets:
-            stripe.api_key = st.secrets["STRIPE_SECRET_KEY"]
+        if get_stripe_client() is not None:
             return True
         else:
             st.warning("⚠️ Stripe not configured. Payment features disabled.")
@@ -74,45 +95,54 @@ PRICING_PLANS = {
 def create_checkout_session(plan_id, user_email=None):
     """
     Create a Stripe Checkout session for a pricing plan.
+    An open session of this browser session for the same plan is reused
+    until shortly before it expires.
     Returns the checkout URL or None if failed.
     """
-    if not init_stripe():
-        return None
-    
     plan = PRICING_PLANS.get(plan_id)
     if not plan:
         st.error("Invalid pricing plan selected.")
         return None
     
+    open_sessions = st.session_state.setdefault("checkout_sessions", {})
+    reuse_key = f"{plan_id}:{user_email or ''}"
+    existing = open_sessions.get(reuse_key)
+    if existing and existing["expires_at"] - time.time() > CHECKOUT_REUSE_MARGIN:
+        metrics.inc("stripe_checkout_reused_total")
+        return existing["url"]
+    
+    if not init_stripe():
+        return None
+    
     try:
-        # Get success and cancel URLs
-        success_url = st.secrets.get("STRIPE_SUCCESS_URL", "http://localhost:8501?payment=success")
-        cancel_url = st.secrets.get("STRIPE_CANCEL_URL", "http://localhost:8501?payment=cancel")
+        client = get_stripe_client()
+        
+        # Product and Price are created once per plan and cached locally
+        price_id = get_price_id(plan_id, plan, client)
         
         # Create checkout session
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'eur',
-                    'unit_amount': plan['price_cents'],
-                    'product_data': {
-                        'name': plan['name'],
-                        'description': f"{plan['credits']} AI Analysis Credits",
-                    },
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
-            success_url=success_url + f"&session_id={{CHECKOUT_SESSION_ID}}&plan={plan_id}",
-            cancel_url=cancel_url,
-            customer_email=user_email,
-            metadata={
-                'plan_id': plan_id,
-                'credits': plan['credits']
-            }
-        )
+        with metrics.timer("stripe_checkout_create"):
+            session = client.checkout.sessions.create(params={
+                'payment_method_types': ['card'],
+                'line_items': [{
+                    'price': price_id,
+                    'quantity': 1,
+                }],
+                'mode': 'payment',
+                'success_url': STRIPE_SUCCESS_URL + f"&session_id={{CHECKOUT_SESSION_ID}}&plan={plan_id}",
+                'cancel_url': STRIPE_CANCEL_URL,
+                'customer_email': user_email,
+                'metadata': {
+                    'plan_id': plan_id,
+                    'credits': plan['credits']
+                }
+            })
         
+        open_sessions[reuse_key] = {
+            'id': session.id,
+            'url': session.url,
+            'expires_at': session.expires_at
+        }
         return session.url
     
     except Exception as e:
@@ -127,7 +157,8 @@ def verify_payment_session(session_id):
         return None
     
     try:
-        session = stripe.checkout.Session.retrieve(session_id)
+        with metrics.timer("stripe_session_retrieve"):
+            session = get_stripe_client().checkout.sessions.retrieve(session_id)
         
         if session.payment_status == 'paid':
             return {
@@ -135,7 +166,8 @@ def verify_payment_session(session_id):
                 'email': session.customer_email,
                 'amount': session.amount_total / 100,
                 'plan_id': session.metadata.get('plan_id'),
-                'credits': int(session.metadata.get('credits', 0))
+                'credits': int(session.metadata.get('credits', 0)),
+                'session_id': session_id
             }
         else:
             return {
@@ -187,33 +219,20 @@ def create_license_from_payment(payment_data):
 # ============================================================================
 
 def log_payment(license_key, payment_data):
-    """Log successful payment to a file."""
-    log_file = "payment_log.json"
-    
+    """Append a successful payment to the payment log."""
     log_entry = {
         'license_key': license_key,
         'timestamp': datetime.now().isoformat(),
         'email': payment_data.get('email'),
         'amount_eur': payment_data.get('amount'),
         'credits': payment_data.get('credits'),
-        'plan_id': payment_data.get('plan_id')
+        'plan_id': payment_data.get('plan_id'),
+        'session_id': payment_data.get('session_id')
     }
     
     try:
-        # Load existing log
-        if os.path.exists(log_file):
-            with open(log_file, 'r') as f:
-                log = json.load(f)
-        else:
-            log = []
-        
-        # Append new entry
-        log.append(log_entry)
-        
-        # Save log
-        with open(log_file, 'w') as f:
-            json.dump(log, f, indent=2)
-        
+        # One fsync'd line; earlier entries are never rewritten
+        append_payment(log_entry)
         return True
     except Exception as e:
         print(f"Error logging payment: {e}")
@@ -295,6 +314,65 @@ def show_pricing_page():
         Yes! Contact support and we'll upgrade your account with additional credits.
         """)
 
+def license_from_log(session_id):
+    """License already issued for a checkout session, or None."""
+    entry = find_session(session_id)
+    if not entry:
+        return None
+    
+    license_info = {
+        'license_key': entry['license_key'],
+        'credits': entry.get('credits', 0),
+        'email': entry.get('email'),
+        'plan_id': entry.get('plan_id')
+    }
+    # Logged but the credits write did not happen (e.g. a crash)
+    if get_credits(license_info['license_key']) is None:
+        set_credits(license_info['license_key'], license_info['credits'])
+    return license_info
+
+def issue_license_for_session(session_id):
+    """
+    Return the license for a paid checkout session, creating it on the
+    first call only. Repeat calls are answered from the processed-session
+    index without contacting Stripe. None if the payment is not verified.
+    """
+    license_info = license_from_log(session_id)
+    if license_info:
+        return license_info
+    
+    # Verify payment (network call, outside the lock)
+    payment_data = verify_payment_session(session_id)
+    if not payment_data or not payment_data.get('success'):
+        return None
+    
+    # One license per checkout session, even if reruns, other app
+    # processes or the webhook worker race for it
+    with session_issue_lock():
+        license_info = license_from_log(session_id)
+        if license_info:
+            return license_info
+        
+        # Create license and add credits to system
+        license_info = create_license_from_payment(payment_data)
+        if license_info:
+            set_credits(license_info['license_key'], license_info['credits'])
+        return license_info
+
+def wait_for_webhook_license(session_id):
+    """
+    License issued by the webhook worker, from local state only.
+    Returns (license_info, status); status is "issued", "waiting" or "failed".
+    """
+    license_info = license_from_log(session_id)
+    if license_info:
+        return license_info, "issued"
+    
+    event = get_webhook_queue().session_status(session_id)
+    if event and event["status"] == "failed":
+        return None, "failed"
+    return None, "waiting"
+
 def handle_payment_callback():
     """Handle payment success/failure callbacks."""
     # Check URL parameters
@@ -306,41 +384,56 @@ def handle_payment_callback():
         if payment_status == "success" and "session_id" in query_params:
             session_id = query_params["session_id"]
             
-            # Verify payment
-            payment_data = verify_payment_session(session_id)
-            
-            if payment_data and payment_data.get('success'):
-                # Create license
-                license_info = create_license_from_payment(payment_data)
+            if WEBHOOKS_ENABLED:
+                # The webhook worker issues the license; only poll locally
+                license_info, status = wait_for_webhook_license(session_id)
+                started = st.session_state.setdefault("payment_wait_started", time.time())
+                
+                if status == "waiting" and time.time() - started < WEBHOOK_WAIT:
+                    st.info("⏳ Confirming your payment with Stripe... This usually takes a few seconds.")
+                    time.sleep(WEBHOOK_POLL_INTERVAL)
+                    st.rerun()
                 
-                if license_info:
-                    st.success("🎉 Payment Successful!")
-                    
-                    st.markdown(f"""
-                    ### Your License Key:
-                    ```
-                    {license_info['license_key']}
-                    ```
-                    
-                    **Credits:** {license_info['credits']}
-                    
-                    ⚠️ **Important:** Save this license key! It has been sent to {license_info['email']}
-                    
-                    You can now use this key to log in and start analyzing items.
-                    """)
-                    
-                    # Add credits to system
-                    from app import save_credits, load_credits
-                    credits = load_credits()
-                    credits[license_info['license_key']] = license_info['credits']
-                    save_credits(credits)
-                    
-                    st.balloons()
-                    
-                    if st.button("🚀 Start Using ValueAI"):
-                        st.rerun()
+                if status == "waiting":
+                    # No event arrived (e.g. receiver down); verify directly
+                    license_info = issue_license_for_session(session_id)
+            else:
+                license_info = issue_license_for_session(session_id)
+            
+            st.session_state.pop("payment_wait_started", None)
+            
+            if license_info:
+                st.session_state.payment_license = license_info
+                # The completed checkout must not be offered again
+                st.session_state.pop("checkout_sessions", None)
+                st.balloons()
+                # Handled; later reruns must not process it again
+                st.query_params.clear()
             else:
                 st.error("❌ Payment verification failed. Please contact support.")
         
         elif payment_status == "cancel":
             st.warning("⚠️ Payment was cancelled. No charges were made.")
+            st.query_params.clear()
+    
+    # Keep showing the new key after the URL parameters are gone
+    license_info = st.session_state.get("payment_license")
+    if license_info:
+        st.success("🎉 Payment Successful!")
+        
+        st.markdown(f"""
+        ### Your License Key:
+        ```
+        {license_info['license_key']}
+        ```
+        
+        **Credits:** {license_info['credits']}
+        
+        ⚠️ **Important:** Save this license key! It has been sent to {license_info['email']}
+        
+        You can now use this key to log in and start analyzing items.
+        """)
+        
+        if st.button("🚀 Start Using ValueAI"):
+            del st.session_state.payment_license
+            st.rerun()
@@ -0,0 +1,188 @@
+"""
+ValueAI - Gemini Quota Scheduler
+Process-wide token bucket that queues Gemini calls by plan-tier priority
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+import metrics
+from payment_log import PaymentLogFollower
+from settings import get_setting
+
+try:
+    from payments import PRICING_PLANS
+except ImportError:
+    PRICING_PLANS = {}
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Gemini requests per minute allowed for the whole process (0 = unlimited)
+GEMINI_RPM = get_setting("GEMINI_RPM", 60)
+
+# Requests that may start at once after an idle period
+GEMINI_BURST = get_setting("GEMINI_BURST", 5)
+
+# Seconds a request may wait in the queue before giving up
+GEMINI_QUEUE_TIMEOUT = get_setting("GEMINI_QUEUE_TIMEOUT", 120.0)
+
+# Dearer plans are served first; demo and unknown keys come last
+PLAN_PRIORITY = {
+    plan_id: rank
+    for rank, plan_id in enumerate(
+        sorted(PRICING_PLANS, key=lambda p: PRICING_PLANS[p]["price_cents"], reverse=True)
+    )
+}
+DEFAULT_PRIORITY = len(PLAN_PRIORITY)
+
+
+class QueueTimeout(Exception):
+    """A request waited longer than GEMINI_QUEUE_TIMEOUT for quota."""
+
+
+# ============================================================================
+# PLAN LOOKUP
+# ============================================================================
+
+_plans = {}
+_plans_follower = PaymentLogFollower()
+_plans_lock = threading.Lock()
+
+
+def plan_for_license(license_key):
+    """Plan id a license key was bought with (from the payment log), or None."""
+    with _plans_lock:
+        try:
+            # Only lines appended since the last lookup are read
+            reset, entries = _plans_follower.read()
+        except Exception:
+            return _plans.get(license_key)
+        if reset:
+            _plans.clear()
+        for entry in entries:
+            _plans[entry.get("license_key")] = entry.get("plan_id")
+        return _plans.get(license_key)
+
+
+def priority_for_license(license_key):
+    """Queue priority of a license key (lower is served first)."""
+    return PLAN_PRIORITY.get(plan_for_license(license_key), DEFAULT_PRIORITY)
+
+
+# ============================================================================
+# SCHEDULER
+# ============================================================================
+
+class QuotaScheduler:
+    """
+    Token bucket refilled at rate_per_minute with room for burst tokens.
+    Callers wait in a priority queue; the head of the queue takes the next
+    token, and equal priorities are served first come, first served.
+    """
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _position(self, ticket):
+        return 1 + sum(1 for other in self._queue if other < ticket)
+
+    def depth(self):
+        """Requests currently waiting."""
+        return len(self._queue)
+
+    def acquire(self, priority=DEFAULT_PRIORITY, on_position=None, timeout=None):
+        """
+        Block until a token is available for this request.
+        on_position(n) is called whenever the 1-based queue position
+        changes. Returns the seconds waited; raises QueueTimeout.
+        """
+        timeout = GEMINI_QUEUE_TIMEOUT if timeout is None else timeout
+        start = time.monotonic()
+        last_position = None
+
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._queue, ticket)
+            metrics.gauge("gemini_queue_depth", len(self._queue))
+
+        try:
+            while True:
+                with self._cond:
+                    self._refill()
+                    if self._queue[0] == ticket and self._tokens >= 1:
+                        self._tokens -= 1
+                        heapq.heappop(self._queue)
+                        ticket = None
+                        self._cond.notify_all()
+                        break
+
+                    position = self._position(ticket)
+                    waited = time.monotonic() - start
+                    if waited >= timeout:
+                        metrics.inc("gemini_queue_timeouts_total")
+                        raise QueueTimeout(
+                            f"The service is busy; no Gemini quota free after {waited:.0f} s"
+                        )
+
+                    if position == last_position:
+                        if position == 1:
+                            # Only the head waits for the next token
+                            self._cond.wait(min((1 - self._tokens) / self.rate, timeout - waited))
+                        else:
+                            # Woken when a request ahead takes its token or leaves
+                            self._cond.wait(timeout - waited)
+                        continue
+
+                last_position = position
+                if on_position is not None:
+                    on_position(position)
+        finally:
+            with self._cond:
+                if ticket is not None:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                    self._cond.notify_all()
+                metrics.gauge("gemini_queue_depth", len(self._queue))
+
+        waited = time.monotonic() - start
+        metrics.observe("gemini_queue_wait_seconds", waited)
+        return waited
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler, or None if GEMINI_RPM is 0."""
+    global _scheduler
+    if GEMINI_RPM <= 0:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = QuotaScheduler(GEMINI_RPM, GEMINI_BURST)
+    return _scheduler
+
+
+def wait_for_quota(license_key=None, on_position=None):
+    """Queue for one Gemini request at the license key's plan priority."""
+    scheduler = get_scheduler()
+    if scheduler is None:
+        return 0.0
+    return scheduler.acquire(priority_for_license(license_key), on_position)
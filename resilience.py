@@ -0,0 +1,203 @@
+"""
+ValueAI - Resilient Calls
+Deadlines, retries with backoff and hedged requests for Gemini calls
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+from settings import get_setting
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+# Seconds one Gemini call may take before it is abandoned
+GEMINI_DEADLINE = get_setting("GEMINI_DEADLINE", 45.0)
+
+# Extra attempts after a retryable error (429, 500, 503, 504, deadline)
+GEMINI_MAX_RETRIES = get_setting("GEMINI_MAX_RETRIES", 3)
+GEMINI_BACKOFF_BASE = get_setting("GEMINI_BACKOFF_BASE", 0.5)
+GEMINI_BACKOFF_MAX = get_setting("GEMINI_BACKOFF_MAX", 8.0)
+
+# Send a second request when the first is slower than the observed p95
+# (doubles the cost of slow calls; off by default)
+GEMINI_HEDGING = get_setting("GEMINI_HEDGING", False)
+GEMINI_HEDGE_MIN_SAMPLES = get_setting("GEMINI_HEDGE_MIN_SAMPLES", 20)
+
+# Threads running Gemini calls for every session in the process
+GEMINI_CALL_THREADS = get_setting("GEMINI_CALL_THREADS", 16)
+
+RETRYABLE_STATUS_CODES = (429, 500, 503, 504)
+
+LATENCY_SERIES = "gemini_call_seconds"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """A Gemini call did not finish within its deadline."""
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=GEMINI_CALL_THREADS,
+                    thread_name_prefix="gemini-call"
+                )
+    return _executor
+
+
+# ============================================================================
+# RETRY POLICY
+# ============================================================================
+
+def is_retryable(error):
+    """True for rate limits, transient server errors and timeouts."""
+    if isinstance(error, TimeoutError):
+        return True
+    code = getattr(error, "code", None)
+    # google.api_core exceptions carry the HTTP status as an int
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Exponential backoff with full jitter for the given retry (0-based)."""
+    base = GEMINI_BACKOFF_BASE if base is None else base
+    cap = GEMINI_BACKOFF_MAX if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def hedge_delay():
+    """Seconds to wait before hedging: the observed p95, once enough calls ran."""
+    if metrics.count(LATENCY_SERIES) < GEMINI_HEDGE_MIN_SAMPLES:
+        return None
+    return metrics.percentile(LATENCY_SERIES, 95)
+
+
+# ============================================================================
+# CALLS
+# ============================================================================
+
+def _timed(request):
+    start = time.perf_counter()
+    result = request()
+    return result, time.perf_counter() - start
+
+
+def _attempt(request, deadline, hedge):
+    """One attempt, optionally hedged. Returns the first successful result."""
+    executor = _get_executor()
+    start = time.perf_counter()
+    primary = executor.submit(_timed, request)
+    futures = [primary]
+
+    delay = hedge_delay() if hedge else None
+    if delay is not None and delay < deadline:
+        done, _ = wait(futures, timeout=delay)
+        if not done:
+            metrics.inc("gemini_hedges_total")
+            futures.append(executor.submit(_timed, request))
+
+    error = None
+    while futures:
+        remaining = deadline - (time.perf_counter() - start)
+        done, _ = wait(futures, timeout=max(0, remaining), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+
+        for future in done:
+            futures.remove(future)
+            try:
+                result, seconds = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+
+            metrics.observe(LATENCY_SERIES, seconds)
+            if future is not primary:
+                metrics.inc("gemini_hedge_wins_total")
+            for other in futures:
+                other.cancel()
+            return result
+
+    if futures or error is None:
+        metrics.inc("gemini_deadline_exceeded_total")
+        raise DeadlineExceeded(f"Gemini call exceeded the {deadline:g}s deadline")
+    raise error
+
+
+def call_with_resilience(request, deadline=None, max_retries=None, hedge=None):
+    """
+    Run request() (a blocking Gemini call) with a per-attempt deadline,
+    retrying retryable errors with exponential backoff and jitter.
+    With hedging, a second request is sent once the first is slower than
+    the observed p95 and whichever succeeds first is returned.
+    The last error is raised when every attempt fails.
+    """
+    deadline = GEMINI_DEADLINE if deadline is None else deadline
+    max_retries = GEMINI_MAX_RETRIES if max_retries is None else max_retries
+    hedge = GEMINI_HEDGING if hedge is None else hedge
+
+    attempt = 0
+    while True:
+        metrics.inc("gemini_calls_total")
+        try:
+            return _attempt(request, deadline, hedge)
+        except Exception as e:
+            metrics.inc("gemini_errors_total")
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            metrics.inc("gemini_retries_total")
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+
+def stream_with_resilience(request, on_chunk, deadline=None, max_retries=None):
+    """
+    Iterate request() (a streaming Gemini call), passing each chunk to
+    on_chunk. A retryable error is retried with backoff only while on_chunk
+    has not yet returned True, i.e. before anything was shown to the user.
+    The deadline covers the whole stream and is checked between chunks.
+    """
+    deadline = GEMINI_DEADLINE if deadline is None else deadline
+    max_retries = GEMINI_MAX_RETRIES if max_retries is None else max_retries
+
+    attempt = 0
+    while True:
+        metrics.inc("gemini_calls_total")
+        start = time.perf_counter()
+        shown = False
+        try:
+            for chunk in request():
+                if time.perf_counter() - start > deadline:
+                    metrics.inc("gemini_deadline_exceeded_total")
+                    raise DeadlineExceeded(f"Gemini call exceeded the {deadline:g}s deadline")
+                shown = on_chunk(chunk) or shown
+            metrics.observe(LATENCY_SERIES, time.perf_counter() - start)
+            return
+        except Exception as e:
+            metrics.inc("gemini_errors_total")
+            if shown or attempt >= max_retries or not is_retryable(e):
+                raise
+            metrics.inc("gemini_retries_total")
+            time.sleep(backoff_delay(attempt))
+            attempt += 1
+
+
+def latency_summary():
+    """p50/p99 call latency in seconds and the hedge win-rate (or None)."""
+    hedges = metrics.get("gemini_hedges_total")
+    return {
+        "p50": metrics.percentile(LATENCY_SERIES, 50),
+        "p99": metrics.percentile(LATENCY_SERIES, 99),
+        "hedges": hedges,
+        "hedge_win_rate": metrics.get("gemini_hedge_wins_total") / hedges if hedges else None
+    }
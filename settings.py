@@ -0,0 +1,36 @@
+"""
+ValueAI - Settings
+Reads tunables from environment variables or Streamlit secrets
+"""
+
+import os
+
+
+def get_setting(name, default=None):
+    """
+    Return a setting from the environment, then Streamlit secrets, else default.
+    Values are converted to the type of the default when one is given.
+    """
+    value = os.environ.get(name)
+
+    if value is None:
+        try:
+            import streamlit as st
+            if name in st.secrets:
+                value = st.secrets[name]
+        except Exception:
+            pass
+
+    if value is None:
+        return default
+
+    if default is None or isinstance(value, type(default)):
+        return value
+
+    if isinstance(default, bool):
+        return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+    try:
+        return type(default)(value)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,205 @@
+"""
+ValueAI - Similar Item Index
+Perceptual-hash index of appraised photos for reusing earlier valuations
+"""
+
+import itertools
+import json
+import sqlite3
+import threading
+import time
+
+from settings import get_setting
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+SIMILAR_ITEMS_FILE = "similar_items.db"
+
+SIMILAR_ITEMS_ENABLED = get_setting("SIMILAR_ITEMS_ENABLED", True)
+
+# Largest Hamming distance (out of 64 bits) still treated as the same item
+SIMILARITY_MAX_DISTANCE = get_setting("SIMILARITY_MAX_DISTANCE", 6)
+
+# The 64-bit hash is split into this many segments for multi-index hashing.
+# With four 16-bit segments any radius up to 7 needs at most 1-bit probes,
+# which keeps lookups under a millisecond at a million entries.
+SEGMENTS = 4
+SEGMENT_BITS = 16
+SEGMENT_MASK = (1 << SEGMENT_BITS) - 1
+
+
+def dhash(image, hash_size=8):
+    """64-bit difference hash: brightness gradients of a 9x8 thumbnail."""
+    from PIL import Image
+
+    pixels = list(
+        image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS).getdata()
+    )
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def _flip_masks(max_bits):
+    """Every SEGMENT_BITS-wide mask with at most max_bits bits set."""
+    masks = [0]
+    for bits in range(1, max_bits + 1):
+        for positions in itertools.combinations(range(SEGMENT_BITS), bits):
+            masks.append(sum(1 << p for p in positions))
+    return masks
+
+
+def _to_signed(value):
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+# ============================================================================
+# INDEX
+# ============================================================================
+
+class SimilarItemIndex:
+    """
+    Multi-index hash table over 64-bit perceptual hashes.
+
+    Each hash is stored in one table per segment. Two hashes within
+    distance r must agree to within r // SEGMENTS bits on at least one
+    segment, so a query only probes those near-matching buckets and checks
+    the few candidates found there. Hashes and valuations are persisted in
+    SQLite; the tables are rebuilt in memory when the index is opened.
+    """
+
+    def __init__(self, path=SIMILAR_ITEMS_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._items = {}
+        self._tables = [{} for _ in range(SEGMENTS)]
+        self._masks = {}
+
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS items (
+                item_id INTEGER PRIMARY KEY,
+                phash INTEGER NOT NULL,
+                valuation TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        for item_id, phash in conn.execute("SELECT item_id, phash FROM items"):
+            self._index(item_id, _to_unsigned(phash))
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._items.values())
+
+    def _index(self, item_id, phash):
+        # Buckets hold the hashes themselves so candidates can be checked
+        # without another lookup; identical hashes share one bucket entry
+        ids = self._items.get(phash)
+        if ids is not None:
+            ids.append(item_id)
+            return
+
+        self._items[phash] = [item_id]
+        for segment, table in enumerate(self._tables):
+            bucket = (phash >> (segment * SEGMENT_BITS)) & SEGMENT_MASK
+            table.setdefault(bucket, []).append(phash)
+
+    def add(self, phash, valuation):
+        """Remember a valuation for a perceptual hash. Returns the item id."""
+        with self._lock:
+            cursor = self._connect().execute(
+                "INSERT INTO items (phash, valuation, created_at) VALUES (?, ?, ?)",
+                (_to_signed(phash), json.dumps(valuation), time.time())
+            )
+            self._index(cursor.lastrowid, phash)
+            return cursor.lastrowid
+
+    def add_many(self, items):
+        """Bulk insert [(phash, valuation)] in one transaction."""
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            with conn:
+                conn.execute("BEGIN")
+                for phash, valuation in items:
+                    cursor = conn.execute(
+                        "INSERT INTO items (phash, valuation, created_at) VALUES (?, ?, ?)",
+                        (_to_signed(phash), json.dumps(valuation), now)
+                    )
+                    self._index(cursor.lastrowid, phash)
+
+    def search(self, phash, max_distance=SIMILARITY_MAX_DISTANCE, limit=None):
+        """Return [(distance, item_id)] within max_distance, nearest first."""
+        probe_bits = max_distance // SEGMENTS
+        masks = self._masks.get(probe_bits)
+        if masks is None:
+            masks = self._masks[probe_bits] = _flip_masks(probe_bits)
+
+        found = set()
+        with self._lock:
+            for segment, table in enumerate(self._tables):
+                bucket = (phash >> (segment * SEGMENT_BITS)) & SEGMENT_MASK
+                for mask in masks:
+                    hashes = table.get(bucket ^ mask)
+                    if hashes:
+                        found.update([h for h in hashes
+                                      if (h ^ phash).bit_count() <= max_distance])
+
+            matches = sorted(
+                ((h ^ phash).bit_count(), item_id)
+                for h in found for item_id in self._items[h]
+            )
+
+        return matches[:limit] if limit else matches
+
+    def find_similar(self, phash, max_distance=SIMILARITY_MAX_DISTANCE, limit=3):
+        """Return up to limit earlier valuations of near-identical photos."""
+        results = []
+        for distance, item_id in self.search(phash, max_distance, limit):
+            row = self._connect().execute(
+                "SELECT valuation, created_at FROM items WHERE item_id = ?", (item_id,)
+            ).fetchone()
+            if row:
+                results.append({
+                    "item_id": item_id,
+                    "distance": distance,
+                    "valuation": json.loads(row[0]),
+                    "created_at": row[1]
+                })
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_similar_items():
+    """Return the process-wide similar item index, or None if disabled."""
+    global _index
+    if not SIMILAR_ITEMS_ENABLED:
+        return None
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SimilarItemIndex()
+    return _index
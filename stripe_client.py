@@ -0,0 +1,151 @@
+"""
+ValueAI - Stripe Client
+Shared Stripe client and the local cache of Product/Price IDs per plan
+
+Set STRIPE_API_BASE to run against stripe-mock (e.g. http://localhost:12111).
+"""
+
+import json
+import os
+import threading
+
+import metrics
+from settings import get_setting
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+STRIPE_API_BASE = get_setting("STRIPE_API_BASE", "https://api.stripe.com")
+
+# Product/Price IDs created for PRICING_PLANS, per Stripe account mode
+STRIPE_PRICES_FILE = "stripe_prices.json"
+
+_client = None
+_client_lock = threading.Lock()
+_prices = None
+_prices_lock = threading.Lock()
+
+
+# ============================================================================
+# CLIENT
+# ============================================================================
+
+def get_stripe_client():
+    """
+    Return the process-wide StripeClient, or None without STRIPE_SECRET_KEY.
+    Secrets are read once; the HTTP session (and its connections) is kept
+    alive and shared by every Streamlit session.
+    """
+    global _client
+    if _client is None:
+        api_key = get_setting("STRIPE_SECRET_KEY")
+        if not api_key:
+            return None
+        with _client_lock:
+            if _client is None:
+                import stripe
+                _client = stripe.StripeClient(
+                    api_key,
+                    http_client=stripe.RequestsClient(),
+                    base_addresses={"api": STRIPE_API_BASE},
+                    max_network_retries=2
+                )
+    return _client
+
+
+def use_stripe_client(client):
+    """Replace the shared client, e.g. with a local fake in tests."""
+    global _client, _prices
+    with _client_lock:
+        _client = client
+    with _prices_lock:
+        _prices = None
+    return client
+
+
+def _account_mode():
+    """Cache namespace: test and live keys (and stripe-mock) have separate IDs."""
+    api_key = get_setting("STRIPE_SECRET_KEY", "")
+    mode = "live" if api_key.startswith(("sk_live", "rk_live")) else "test"
+    return f"{mode}@{STRIPE_API_BASE}"
+
+
+# ============================================================================
+# PRICE SYNC
+# ============================================================================
+
+def _load_prices():
+    global _prices
+    if _prices is None:
+        try:
+            with open(STRIPE_PRICES_FILE, "r") as f:
+                _prices = json.load(f)
+        except (OSError, ValueError):
+            _prices = {}
+    return _prices
+
+
+def _save_prices(prices):
+    tmp_path = f"{STRIPE_PRICES_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(prices, f, indent=2)
+    os.replace(tmp_path, STRIPE_PRICES_FILE)
+
+
+def _lookup_key(plan_id, plan):
+    # A new price amount gets a new Price; Stripe prices are immutable
+    return f"valueai_{plan_id}_{plan['price_cents']}"
+
+
+def get_price_id(plan_id, plan, client=None):
+    """
+    Stripe Price ID for a plan: from the local cache, else found by
+    lookup_key, else created (Product + Price) once and cached.
+    """
+    client = client or get_stripe_client()
+    lookup_key = _lookup_key(plan_id, plan)
+
+    with _prices_lock:
+        account = _load_prices().setdefault(_account_mode(), {})
+        cached = account.get(plan_id)
+        if cached and cached.get("lookup_key") == lookup_key:
+            return cached["price"]
+
+        with metrics.timer("stripe_price_sync"):
+            found = client.prices.list(params={"lookup_keys": [lookup_key], "limit": 1}).data
+            if found:
+                price_id, product_id = found[0].id, found[0].product
+            else:
+                product = client.products.create(
+                    params={
+                        "name": plan["name"],
+                        "description": f"{plan['credits']} AI Analysis Credits",
+                        "metadata": {"plan_id": plan_id}
+                    },
+                    options={"idempotency_key": f"product-{lookup_key}"}
+                )
+                price = client.prices.create(
+                    params={
+                        "product": product.id,
+                        "unit_amount": plan["price_cents"],
+                        "currency": "eur",
+                        "lookup_key": lookup_key,
+                        "metadata": {"plan_id": plan_id, "credits": plan["credits"]}
+                    },
+                    options={"idempotency_key": f"price-{lookup_key}"}
+                )
+                price_id, product_id = price.id, product.id
+
+        account[plan_id] = {"product": product_id, "price": price_id, "lookup_key": lookup_key}
+        try:
+            _save_prices(_prices)
+        except OSError as e:
+            # Read-only deployments keep the IDs in memory only
+            print(f"Error saving Stripe price cache: {e}")
+        return price_id
+
+
+def sync_prices(plans, client=None):
+    """Make sure every plan has a cached Price ID; returns {plan_id: price_id}."""
+    return {plan_id: get_price_id(plan_id, plan, client) for plan_id, plan in plans.items()}
@@ -0,0 +1,114 @@
+"""
+ValueAI - Valuation Result
+Typed form of a Gemini valuation and the JSON schema requested from the model
+"""
+
+import json
+import re
+import typing
+
+
+class ValuationSchema(typing.TypedDict):
+    """Response schema passed to Gemini (prices are numbers in EUR)."""
+    item_name: str
+    condition: str
+    price_new: float
+    price_used_fast: float
+    price_collector: float
+    description: str
+
+
+PRICE_FIELDS = ("price_new", "price_used_fast", "price_collector")
+
+
+def parse_price(value):
+    """
+    Convert a price to float. Accepts numbers and strings such as
+    "€1,200", "1.200,50 EUR" or "approx. 45". Raises ValueError otherwise.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Invalid price: {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        raise ValueError(f"Invalid price: {value!r}")
+
+    match = re.search(r"\d[\d.,\s]*", value)
+    if not match:
+        raise ValueError(f"Invalid price: {value!r}")
+    number = re.sub(r"\s", "", match.group()).rstrip(".,")
+
+    # The last separator is the decimal point if two or fewer digits follow
+    last = max(number.rfind("."), number.rfind(","))
+    if last != -1 and len(number) - last - 1 <= 2:
+        integer, fraction = number[:last], number[last + 1:]
+    else:
+        integer, fraction = number, ""
+    integer = integer.replace(".", "").replace(",", "")
+
+    return float(f"{integer}.{fraction or 0}")
+
+
+def format_price(value):
+    """Display form of a price: whole euros without decimals."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"{value:,.0f}" if float(value).is_integer() else f"{value:,.2f}"
+    return str(value)
+
+
+class ValuationResult:
+    """One item valuation with numeric prices."""
+
+    __slots__ = ("item_name", "condition", "price_new", "price_used_fast",
+                 "price_collector", "description")
+
+    def __init__(self, item_name, condition, price_new, price_used_fast,
+                 price_collector, description):
+        self.item_name = item_name
+        self.condition = condition
+        self.price_new = price_new
+        self.price_used_fast = price_used_fast
+        self.price_collector = price_collector
+        self.description = description
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build from a decoded JSON object. Raises ValueError if invalid."""
+        if not isinstance(data, dict) or not data.get("item_name"):
+            raise ValueError("Valuation is missing item_name")
+
+        return cls(
+            item_name=str(data["item_name"]),
+            condition=str(data.get("condition") or "Not specified"),
+            price_new=parse_price(data.get("price_new", 0)),
+            price_used_fast=parse_price(data.get("price_used_fast", 0)),
+            price_collector=parse_price(data.get("price_collector", 0)),
+            description=str(data.get("description") or "")
+        )
+
+    @classmethod
+    def from_json(cls, text):
+        """Decode model output. Raises ValueError (incl. JSONDecodeError)."""
+        return cls.from_dict(json.loads(text))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def get(self, key, default=None):
+        """Dict-style field access, so reports can take either form."""
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None or value == "" else value
+
+    def __repr__(self):
+        return f"ValuationResult({self.item_name!r}, used_fast={self.price_used_fast})"
+
+
+def repair_json_text(text):
+    """
+    Best-effort cleanup of almost-JSON model output: strips code fences and
+    surrounding prose, and drops trailing commas.
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return text
+    return re.sub(r",\s*([}\]])", r"\1", text[start:end + 1])
@@ -0,0 +1,148 @@
+"""
+ValueAI - Valuation Cache
+Persistent cache of Gemini valuations keyed by the normalized image bytes
+"""
+
+import hashlib
+import itertools
+import json
+import sqlite3
+import threading
+import time
+
+from settings import get_setting
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+VALUATION_CACHE_FILE = "valuation_cache.db"
+
+VALUATION_CACHE_ENABLED = get_setting("VALUATION_CACHE_ENABLED", True)
+
+# Least recently used entries are evicted beyond this many valuations
+VALUATION_CACHE_MAX_ENTRIES = get_setting("VALUATION_CACHE_MAX_ENTRIES", 50000)
+
+# Inserts between two eviction passes; each process may overshoot the limit by this much
+VALUATION_CACHE_EVICT_EVERY = get_setting("VALUATION_CACHE_EVICT_EVERY", 100)
+
+# Seconds a valuation stays valid (prices drift, so default to 30 days)
+VALUATION_CACHE_TTL = get_setting("VALUATION_CACHE_TTL", 30 * 24 * 3600)
+
+# Whether a cache hit still costs the user a credit
+CHARGE_CACHE_HITS = get_setting("CHARGE_CACHE_HITS", True)
+
+
+def image_cache_key(blob, prompt_version):
+    """SHA-256 of the preprocessed image bytes and the prompt version."""
+    digest = hashlib.sha256()
+    digest.update(prompt_version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(blob["mime_type"].encode("ascii"))
+    digest.update(b"\0")
+    digest.update(blob["data"])
+    return digest.hexdigest()
+
+
+# ============================================================================
+# CACHE
+# ============================================================================
+
+class ValuationCache:
+    """SQLite-backed LRU cache with a TTL, shared by all sessions."""
+
+    def __init__(self, path=VALUATION_CACHE_FILE, max_entries=VALUATION_CACHE_MAX_ENTRIES,
+                 ttl=VALUATION_CACHE_TTL, evict_every=VALUATION_CACHE_EVICT_EVERY):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.evict_every = max(1, evict_every)
+        self._puts = itertools.count()
+        self._local = threading.local()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS valuations (
+                cache_key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            ) WITHOUT ROWID
+        """)
+        self._connect().execute("""
+            CREATE INDEX IF NOT EXISTS valuations_last_access
+            ON valuations (last_access)
+        """)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, cache_key):
+        """Return the cached valuation dict, or None."""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "SELECT result, created_at FROM valuations WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+
+        if row is None or now - row[1] > self.ttl:
+            if row is not None:
+                conn.execute("DELETE FROM valuations WHERE cache_key = ?", (cache_key,))
+            self.stats["misses"] += 1
+            return None
+
+        conn.execute(
+            "UPDATE valuations SET last_access = ? WHERE cache_key = ?", (now, cache_key)
+        )
+        self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, cache_key, result):
+        """Store a valuation; every evict_every puts, evict the least recently used overflow."""
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO valuations (cache_key, result, created_at, last_access) "
+            "VALUES (?, ?, ?, ?)",
+            (cache_key, json.dumps(result), now, now)
+        )
+
+        if next(self._puts) % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """Delete the least recently used entries beyond max_entries."""
+        cursor = self._connect().execute(
+            "DELETE FROM valuations WHERE cache_key IN ("
+            "SELECT cache_key FROM valuations ORDER BY last_access "
+            "LIMIT max(0, (SELECT COUNT(*) FROM valuations) - ?))",
+            (self.max_entries,)
+        )
+        self.stats["evictions"] += cursor.rowcount
+        return cursor.rowcount
+
+    def clear(self):
+        self._connect().execute("DELETE FROM valuations")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_valuation_cache():
+    """Return the process-wide valuation cache, or None if it is disabled."""
+    global _cache
+    if not VALUATION_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ValuationCache()
+    return _cache
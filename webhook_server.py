@@ -0,0 +1,398 @@
+"""
+ValueAI - Stripe Webhook Receiver
+Verifies checkout.session.completed events, queues them durably and issues
+licenses in a background worker, so the Streamlit page only polls locally
+
+Run next to the app:  python webhook_server.py
+Point a Stripe webhook endpoint at http://<host>:WEBHOOK_PORT/webhook and
+put its signing secret in STRIPE_WEBHOOK_SECRET.
+"""
+
+import hashlib
+import hmac
+import json
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import metrics
+from settings import get_setting
+
+# ============================================================================
+# CONFIGURATION
+# ============================================================================
+
+STRIPE_WEBHOOK_SECRET = get_setting("STRIPE_WEBHOOK_SECRET", "")
+
+# With a signing secret configured, licenses are issued by the worker
+# and the payment callback only reads the queue
+WEBHOOKS_ENABLED = bool(STRIPE_WEBHOOK_SECRET)
+
+WEBHOOK_PORT = get_setting("WEBHOOK_PORT", 8502)
+WEBHOOK_QUEUE_FILE = "webhook_queue.db"
+
+# Reject signatures older than this many seconds (replay protection)
+WEBHOOK_TOLERANCE = get_setting("WEBHOOK_TOLERANCE", 300)
+
+# Failed events are retried with a growing delay, then marked failed
+WEBHOOK_MAX_ATTEMPTS = get_setting("WEBHOOK_MAX_ATTEMPTS", 8)
+
+HANDLED_EVENTS = ("checkout.session.completed", "checkout.session.async_payment_succeeded")
+
+
+class SignatureError(Exception):
+    """The Stripe-Signature header does not match the payload."""
+
+
+# ============================================================================
+# SIGNATURES
+# ============================================================================
+
+def sign_payload(payload, secret, timestamp=None):
+    """Stripe-Signature header value for payload (for synthetic test events)."""
+    timestamp = int(time.time()) if timestamp is None else int(timestamp)
+    if isinstance(payload, str):
+        payload = payload.encode("utf-8")
+    signed = f"{timestamp}.".encode("utf-8") + payload
+    signature = hmac.new(secret.encode("utf-8"), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def verify_signature(payload, header, secret, tolerance=None, now=None):
+    """
+    Check a Stripe-Signature header (the same scheme as
+    stripe.Webhook.construct_event) and return the decoded event.
+    Raises SignatureError.
+    """
+    tolerance = WEBHOOK_TOLERANCE if tolerance is None else tolerance
+    now = time.time() if now is None else now
+
+    timestamp, signatures = None, []
+    for part in (header or "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name == "t":
+            timestamp = value
+        elif name == "v1":
+            signatures.append(value)
+
+    if not timestamp or not timestamp.isdigit() or not signatures:
+        raise SignatureError("Malformed Stripe-Signature header")
+    if abs(now - int(timestamp)) > tolerance:
+        raise SignatureError("Timestamp outside the tolerance zone")
+
+    expected = sign_payload(payload, secret, int(timestamp)).split("v1=", 1)[1]
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise SignatureError("No signature matches the payload")
+
+    return json.loads(payload)
+
+
+# ============================================================================
+# QUEUE
+# ============================================================================
+
+class WebhookQueue:
+    """
+    Durable event queue in SQLite. Events are keyed by Stripe's event id,
+    so redeliveries of the same event are stored only once.
+    Status: pending -> processing -> done | failed.
+    """
+
+    def __init__(self, path=WEBHOOK_QUEUE_FILE):
+        self.path = path
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                event_id TEXT PRIMARY KEY,
+                event_type TEXT NOT NULL,
+                session_id TEXT,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                license_key TEXT,
+                error TEXT,
+                received_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS events_session_id ON events (session_id)
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS events_pending ON events (status, next_attempt_at)
+        """)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, event):
+        """Store an event; returns False if it was already queued."""
+        if not event.get("id"):
+            raise ValueError("Event has no id")
+        session = event.get("data", {}).get("object", {})
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT OR IGNORE INTO events "
+            "(event_id, event_type, session_id, payload, next_attempt_at, received_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (event["id"], event.get("type"), session.get("id"), json.dumps(event), now, now)
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, now=None):
+        """Take the oldest due pending event as (event_id, event), or None."""
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT event_id, payload FROM events "
+                "WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY received_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE events SET status = 'processing', attempts = attempts + 1 "
+                    "WHERE event_id = ?",
+                    (row[0],)
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return (row[0], json.loads(row[1])) if row else None
+
+    def complete(self, event_id, license_key):
+        self._connect().execute(
+            "UPDATE events SET status = 'done', license_key = ?, error = NULL WHERE event_id = ?",
+            (license_key, event_id)
+        )
+
+    def fail(self, event_id, error):
+        """Schedule a retry with exponential delay, or give up after the last attempt."""
+        self._connect().execute(
+            "UPDATE events SET "
+            "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "next_attempt_at = ? + MIN(3600, 5 * (1 << attempts)), error = ? "
+            "WHERE event_id = ?",
+            (WEBHOOK_MAX_ATTEMPTS, time.time(), str(error), event_id)
+        )
+
+    def recover(self):
+        """Return events left 'processing' by a crashed worker to the queue."""
+        self._connect().execute("UPDATE events SET status = 'pending' WHERE status = 'processing'")
+
+    def session_status(self, session_id):
+        """{"status", "license_key", "error"} of a checkout session, or None if unseen."""
+        row = self._connect().execute(
+            "SELECT status, license_key, error FROM events WHERE session_id = ? "
+            "ORDER BY (license_key IS NOT NULL) DESC, received_at DESC LIMIT 1",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "license_key": row[1], "error": row[2]}
+
+    def counts(self):
+        """Number of events per status."""
+        return dict(self._connect().execute("SELECT status, COUNT(*) FROM events GROUP BY status"))
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_webhook_queue():
+    """Return the process-wide webhook queue."""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = WebhookQueue()
+    return _queue
+
+
+# ============================================================================
+# WORKER
+# ============================================================================
+
+def payment_data_from_session(session):
+    """The payment_data dict create_license_from_payment expects, from a Checkout Session."""
+    metadata = session.get("metadata") or {}
+    details = session.get("customer_details") or {}
+    return {
+        "success": session.get("payment_status") == "paid",
+        "email": session.get("customer_email") or details.get("email"),
+        "amount": (session.get("amount_total") or 0) / 100,
+        "plan_id": metadata.get("plan_id"),
+        "credits": int(metadata.get("credits", 0)),
+        "session_id": session.get("id")
+    }
+
+
+def issue_license_from_event(event):
+    """
+    Issue the license for a checkout event exactly once per session.
+    Returns the license key, or None if the session is not paid yet.
+    """
+    from payments import create_license_from_payment, license_from_log
+    from payment_log import session_issue_lock
+    from credit_store import get_credits, set_credits
+
+    payment_data = payment_data_from_session(event["data"]["object"])
+
+    # Shared with the page's fallback path, which may run in another process
+    with session_issue_lock():
+        # Already issued (redelivered event, or the fallback path);
+        # license_from_log also restores credits a failed attempt never saved
+        license_info = license_from_log(payment_data["session_id"])
+        if license_info:
+            if get_credits(license_info["license_key"]) is None:
+                raise RuntimeError("Credits could not be saved")
+            return license_info["license_key"]
+
+        if not payment_data["success"]:
+            return None
+
+        license_info = create_license_from_payment(payment_data)
+        if not license_info:
+            raise RuntimeError("License could not be created")
+        if not set_credits(license_info["license_key"], license_info["credits"]):
+            raise RuntimeError("Credits could not be saved")
+        return license_info["license_key"]
+
+
+class WebhookWorker:
+    """Background thread draining the queue through issue(event)."""
+
+    def __init__(self, queue, issue=issue_license_from_event, poll_interval=0.5):
+        self.queue = queue
+        self.issue = issue
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stopped = False
+
+    def notify(self):
+        self._wake.set()
+
+    def run_once(self):
+        """Process one due event; returns False if there was none."""
+        claimed = self.queue.claim()
+        if claimed is None:
+            return False
+
+        event_id, event = claimed
+        try:
+            with metrics.timer("webhook_issue"):
+                license_key = self.issue(event)
+            self.queue.complete(event_id, license_key)
+            metrics.inc("webhook_events_processed_total")
+        except Exception as e:
+            print(f"Error processing webhook event {event_id}: {e}")
+            self.queue.fail(event_id, e)
+            metrics.inc("webhook_events_failed_total")
+        return True
+
+    def run(self):
+        self.queue.recover()
+        while not self._stopped:
+            if not self.run_once():
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def start(self):
+        threading.Thread(target=self.run, name="webhook-worker", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+
+
+# ============================================================================
+# HTTP RECEIVER
+# ============================================================================
+
+def make_handler(queue, worker=None, secret=None):
+    """Request handler class bound to a queue and signing secret."""
+    secret = STRIPE_WEBHOOK_SECRET if secret is None else secret
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+        def _reply(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"ok": True, "events": queue.counts()})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/webhook":
+                self._reply(404, {"error": "not found"})
+                return
+
+            payload = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            try:
+                event = verify_signature(payload, self.headers.get("Stripe-Signature"), secret)
+            except (SignatureError, ValueError) as e:
+                metrics.inc("webhook_rejected_total")
+                self._reply(400, {"error": str(e)})
+                return
+            if not event.get("id"):
+                metrics.inc("webhook_rejected_total")
+                self._reply(400, {"error": "event has no id"})
+                return
+
+            # Acknowledge quickly; the worker does the slow part
+            queued = False
+            if event.get("type") in HANDLED_EVENTS:
+                queued = queue.enqueue(event)
+                if queued and worker is not None:
+                    worker.notify()
+            metrics.inc("webhook_events_received_total")
+            self._reply(200, {"received": True, "queued": queued})
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+
+def serve(port=WEBHOOK_PORT, queue=None, issue=issue_license_from_event):
+    """Run the receiver and the worker until interrupted."""
+    if not STRIPE_WEBHOOK_SECRET:
+        raise SystemExit("STRIPE_WEBHOOK_SECRET is not configured")
+
+    queue = queue or get_webhook_queue()
+    worker = WebhookWorker(queue, issue).start()
+    server = ThreadingHTTPServer(("0.0.0.0", port), make_handler(queue, worker))
+    print(f"Listening for Stripe webhooks on port {port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve()